@@ -1,9 +1,35 @@
 import random
+import time
+import threading
+import json
+import chessEngine, chessBitboards, chessTranspositionTable, chessBook, chessTablebase
 
-pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "P": 1}
+pieceScore = chessEngine.pieceScore # material values, the piece square tables are in chessEngine too
 CHECKMATE = 1000
 STALEMATE = 0
 DEPTH = 2 # controls how many moves ahead findMoveMinMax function looks
+MAX_DEPTH = 64 # deepest iteration when searching on a time or node budget
+MATE_SCORE = CHECKMATE - 2 * MAX_DEPTH - 128 # scores beyond this are mates (tablebase ones can be 127 plies past the leaf), closer ones score higher
+DELTA_MARGIN = 2 # quiescence search skips captures that can't bring the score within this of alpha
+QUIESCENCE_EVASION_PLIES = 2 # how many plies into the quiescence search checks are answered with all evasions
+NULL_WINDOW = 0.005 # width of a zero window, scores are whole hundredths of a pawn so none can fall inside it
+NULL_MOVE_REDUCTION = 2 # how much shallower than the moves themselves the null move is searched
+LMR_MOVES = 3 # moves searched to full depth before late move reductions start
+LMR_DEPTH = 3 # least depth left at which late moves are reduced
+ASPIRATION_WINDOW = 0.25 # each depth first searches this far either side of the last depth's score
+ASPIRATION_MAX = 4 # a window that has to grow past this is opened all the way instead
+hashSizeMB = 16 # memory budget for the transposition table
+transpositionTable = None # created on first use and kept between calls to findBestMove
+useBook = True # play moves from the opening book (chessBook) without searching while there are any
+useTablebases = True # score positions with few enough pieces from the endgame tablebases (chessTablebase)
+statsLog = None # path of a JSON lines file every search appends its searchStats to
+clock = time.perf_counter # shorter lookup for the timing in the search's inner loops
+
+def getTranspositionTable():
+    global transpositionTable
+    if transpositionTable is None:
+        transpositionTable = chessTranspositionTable.transpositionTable(hashSizeMB)
+    return transpositionTable
 
 def findRandomMove(validMoves):
     return validMoves[random.randint(0, len(validMoves)-1)] # returns number between first and second input
@@ -43,14 +69,85 @@ def findRandomMove(validMoves):
 #        gs.undo()
 #    return bestPlayerMove
 
-# helper function for findMoveMinMax (to make first recursive call)
-def findBestMove(gs, validMoves):
-    global nextMove
-    nextMove = None
-    #findMoveMinMax(gs, validMoves, DEPTH, gs.whiteTurn)
-    findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteTurn else -1)
+# helper function for the search, returns the move to play (None if there is none)
+# with no budget it searches to DEPTH, with timeLimit (seconds) and/or nodeLimit it deepens until the
+# budget runs out and plays the best move of the last depth that finished
+def findBestMove(gs, validMoves, depth=None, timeLimit=None, nodeLimit=None):
+    result = bookResult(gs, validMoves) or tablebaseResult(gs, validMoves)
+    if result is not None:
+        return result.bestMove
+    return search(gs, validMoves, depth, timeLimit, nodeLimit).bestMove
+
+# searchResult holding a move from the opening book, None if useBook is off or the position isn't in it
+def bookResult(gs, validMoves):
+    if not useBook:
+        return None
+    move = chessBook.getBook().findMove(gs, validMoves)
+    if move is None:
+        return None
+    result = searchResult()
+    result.bestMove = move
+    result.pv = [move]
+    result.book = True
+    return result
+
+# searchResult with the quickest mate (or slowest loss) from the endgame tablebases,
+# None if useTablebases is off or there is no table for the position
+def tablebaseResult(gs, validMoves):
+    if not useTablebases or len(validMoves) == 0 or chessTablebase.probe(gs) is None:
+        return None
+    result = searchResult()
+    result.score = -CHECKMATE
+    for move in validMoves:
+        gs.makeMove(move)
+        value = chessTablebase.probe(gs)
+        gs.undo()
+        if value is None: # a pawn that just moved two squares can be taken en passant
+            return None
+        score = -tablebaseScore(value, 1)
+        if result.bestMove is None or score > result.score:
+            result.bestMove = move
+            result.score = score
+    result.pv = [result.bestMove]
+    result.tablebase = True
+    return result
+
+# same as findBestMove but returns the whole searchResult
+def search(gs, validMoves, depth=None, timeLimit=None, nodeLimit=None):
+    if depth is None:
+        depth = DEPTH if timeLimit is None and nodeLimit is None else MAX_DEPTH
+    return searcher().search(gs, validMoves, depth, timeLimit, nodeLimit)
+
+# runs a search on its own thread, on a copy of the game state so the caller can keep drawing the real one
+# ponderMove is played on the copy first, to search the position expected after the opponent's reply
+# (with no budget a ponder search goes on deepening until it is stopped)
+class backgroundSearch():
+    def __init__(self, gs, depth=None, timeLimit=None, nodeLimit=None, ponderMove=None):
+        self.gs = chessEngine.gameState.fromFEN(gs.toFEN(), gs.useBitboards)
+        self.ponderMove = ponderMove
+        if ponderMove is not None:
+            self.gs.makeMove(ponderMove)
+        if depth is None:
+            depth = MAX_DEPTH if ponderMove is not None or timeLimit is not None or nodeLimit is not None else DEPTH
+        self.searcher = searcher()
+        self.result = None
+        self.thread = threading.Thread(target=self.run, args=(depth, timeLimit, nodeLimit), daemon=True)
+        self.thread.start()
+
+    def run(self, depth, timeLimit, nodeLimit):
+        validMoves = self.gs.getValidMoves()
+        self.result = bookResult(self.gs, validMoves) or tablebaseResult(self.gs, validMoves)
+        if self.result is None:
+            self.result = self.searcher.search(self.gs, validMoves, depth, timeLimit, nodeLimit)
 
-    return nextMove
+    def isDone(self):
+        return not self.thread.is_alive()
+
+    # stops the search and returns its result (the last depth that finished)
+    def stop(self):
+        self.searcher.stop()
+        self.thread.join()
+        return self.result
 
 def findMoveMinMax(gs, validMoves, depth, whiteTurn):
     global nextMove
@@ -83,30 +180,569 @@ def findMoveMinMax(gs, validMoves, depth, whiteTurn):
             gs.undo()
         return minScore
 
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-    
-    # move ordering - implement later
-    maxScore = -CHECKMATE
-    for move in validMoves:
+# outcome of a search, filled in as each depth of the iterative deepening finishes
+class searchResult():
+    def __init__(self):
+        self.bestMove = None
+        self.score = 0 # from the point of view of the side to move
+        self.depth = 0 # last depth searched to completion
+        self.pv = [] # principal variation (expected moves for both sides, starting with bestMove)
+        self.nodes = 0
+        self.time = 0.0
+        self.stopped = False # True if the budget ran out in the middle of a depth
+        self.book = False # True if bestMove came from the opening book and nothing was searched
+        self.tablebase = False # True if bestMove came from the endgame tablebases and nothing was searched
+        self.stats = None # searchStats of the search (None for book and tablebase moves)
+
+# counters from one search, cheap enough to leave on: plain counts, and a clock read either side of
+# move generation and static evaluation
+class searchStats():
+    def __init__(self):
+        self.depth = 0 # last depth searched to completion
+        self.time = 0.0
+        self.nodes = 0 # alpha-beta and quiescence nodes
+        self.quiescenceNodes = 0
+        self.leafEvaluations = 0 # static evaluations (quiescence stand pats and leaves scored straight away)
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0 # cutoffs caused by the first move tried
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.moveGenerations = 0 # getValidMoves and getCaptureMoves calls inside the search
+        self.moveGenerationTime = 0.0
+        self.evaluationTime = 0.0
+        self.iterationNodes = [] # nodes each finished depth of the iterative deepening took
+        self.nullMoveCutoffs = 0
+        self.reductions = 0 # late moves searched a ply shallower
+        self.reductionReSearches = 0 # reduced moves that beat alpha and were searched again at full depth
+        self.pvsReSearches = 0 # zero window searches that landed inside the window and were searched again with it
+        self.checkExtensions = 0
+        self.aspirationFailHighs = 0 # depths searched again because the score was above the aspiration window
+        self.aspirationFailLows = 0 # and below it
+        self.depths = None # per depth breakdown (list of dicts), only if the searcher's perDepthStats was on
+
+    def nodesPerSecond(self):
+        return self.nodes / self.time if self.time > 0 else 0.0
+
+    # growth in nodes from one depth to the next, from the last two finished depths
+    def branchingFactor(self):
+        if len(self.iterationNodes) >= 2 and self.iterationNodes[-2] > 0:
+            return self.iterationNodes[-1] / self.iterationNodes[-2]
+        return self.nodes ** (1 / self.depth) if self.depth > 0 else 0.0
+
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0
+
+    def ttHitRate(self):
+        return self.ttHits / self.ttProbes if self.ttProbes else 0.0
+
+    def toDict(self):
+        stats = {"depth": self.depth, "time": round(self.time, 6), "nodes": self.nodes, "quiescenceNodes": self.quiescenceNodes,
+                 "leafEvaluations": self.leafEvaluations, "nps": round(self.nodesPerSecond()),
+                 "branchingFactor": round(self.branchingFactor(), 3), "betaCutoffs": self.betaCutoffs,
+                 "firstMoveCutoffRate": round(self.firstMoveCutoffRate(), 4), "ttProbes": self.ttProbes, "ttHits": self.ttHits,
+                 "ttHitRate": round(self.ttHitRate(), 4), "moveGenerations": self.moveGenerations,
+                 "moveGenerationTime": round(self.moveGenerationTime, 6), "evaluationTime": round(self.evaluationTime, 6),
+                 "nullMoveCutoffs": self.nullMoveCutoffs, "reductions": self.reductions,
+                 "reductionReSearches": self.reductionReSearches, "pvsReSearches": self.pvsReSearches,
+                 "checkExtensions": self.checkExtensions, "aspirationFailHighs": self.aspirationFailHighs,
+                 "aspirationFailLows": self.aspirationFailLows, "iterationNodes": self.iterationNodes}
+        if self.depths is not None:
+            stats["depths"] = self.depths
+        return stats
+
+    def toJSON(self):
+        return json.dumps(self.toDict())
+
+class searchAborted(Exception):
+    pass
+
+# holds everything one search needs, so several searches can run at once
+# the transposition table is shared with other searches unless one is passed in
+class searcher():
+    checkEvery = 64 # nodes between looks at the clock
+
+    def __init__(self, tt=None, moveOrdering=True, quiescence=True, pvs=True, nullMove=True, lateMoveReductions=True, checkExtensions=True,
+                 aspiration=True):
+        self.tt = tt if tt is not None else getTranspositionTable()
+        self.moveOrdering = moveOrdering # False only tries the hash/pv move first (for comparisons)
+        self.quiescence = quiescence # False scores leaves straight away, even in the middle of an exchange
+        # the pruning and extensions can be turned off one at a time to measure what each saves (see chessBench)
+        self.pvs = pvs # moves after the first are searched with a zero window, and again only if they beat alpha
+        self.nullMove = nullMove # positions where passing still beats beta are cut off after a shallow search
+        self.lateMoveReductions = lateMoveReductions # quiet moves late in the ordering are searched a ply shallower
+        self.checkExtensions = checkExtensions # moves that give check are searched a ply deeper
+        self.aspiration = aspiration # each depth starts with a narrow window around the last score (aspiration window)
+        self.tablebases = useTablebases # positions with few enough pieces are scored from the tablebases
+        self.stopRequested = False
+        self.stopEvent = None # optional Event another process sets to stop the search (see chessParallel)
+        self.firstDepth = 1 # depth the iterative deepening starts at
+        self.onIteration = None # optional callback(result) after every finished depth
+        self.perDepthStats = False # True adds a breakdown of every finished depth to result.stats
+
+    # asks a running search (for example on another thread) to finish as soon as possible
+    def stop(self):
+        self.stopRequested = True
+
+    def isStopped(self):
+        return self.stopRequested or (self.stopEvent is not None and self.stopEvent.is_set())
+
+    def search(self, gs, validMoves, maxDepth=DEPTH, timeLimit=None, nodeLimit=None):
+        result = searchResult()
+        self.result = result
+        self.startSearch(timeLimit, nodeLimit)
+        if len(validMoves) == 0:
+            result.stats = self.collectStats(result)
+            return result
+        result.bestMove = validMoves[0]
+        result.pv = [validMoves[0]]
+
+        turnMultiplier = 1 if gs.whiteTurn else -1
+        rootLength = len(gs.moveLog)
+        iterationStart = 0
+        for depth in range(self.firstDepth, maxDepth + 1):
+            self.canAbort = depth > self.firstDepth # always finish the first depth so there is a move to play
+            self.rootDepth = depth
+            self.previousPv = result.pv if depth > self.firstDepth else []
+            # the score rarely moves far from one depth to the next, so the search starts with a window
+            # around the last one, which cuts off more; a score outside it only bounds the true one, so the
+            # depth is searched again with the window widened on that side
+            delta = ASPIRATION_WINDOW
+            if self.aspiration and depth > self.firstDepth and abs(result.score) < MATE_SCORE:
+                alpha, beta = result.score - delta, result.score + delta
+            else:
+                alpha, beta = -CHECKMATE, CHECKMATE
+            try:
+                while True:
+                    self.followPv = True
+                    score = self.findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier, 0)
+                    if score <= alpha and alpha > -CHECKMATE:
+                        self.aspirationFailLows += 1
+                    elif score >= beta and beta < CHECKMATE:
+                        self.aspirationFailHighs += 1
+                    else:
+                        break
+                    delta *= 4
+                    if delta > ASPIRATION_MAX:
+                        alpha, beta = -CHECKMATE, CHECKMATE
+                    elif score <= alpha:
+                        alpha = score - delta
+                    else:
+                        beta = score + delta
+            except searchAborted:
+                while len(gs.moveLog) > rootLength: # unwind the moves the search had made
+                    gs.undo()
+                result.stopped = True
+                break
+            result.bestMove = self.pv[0]
+            result.pv = self.extendPv(gs, self.pv, depth)
+            result.score = score
+            result.depth = depth
+            result.nodes = self.nodes
+            result.time = time.perf_counter() - self.startTime
+            self.iterationNodes.append(self.nodes - iterationStart)
+            iterationStart = self.nodes
+            if self.perDepthStats:
+                self.depths.append({"depth": depth, "nodes": self.iterationNodes[-1], "time": round(result.time, 6), "score": score,
+                                    "bestMove": result.bestMove.getChessNotation(), "betaCutoffs": self.betaCutoffs,
+                                    "firstMoveCutoffs": self.firstMoveCutoffs, "ttHits": self.tt.hits - self.ttHitsStart,
+                                    "aspirationFails": self.aspirationFailHighs + self.aspirationFailLows})
+            if self.onIteration is not None:
+                self.onIteration(result)
+            if abs(score) >= MATE_SCORE or self.isStopped():
+                break
+            # the next depth takes several times longer, don't start it if it can't finish
+            if self.deadline is not None and time.perf_counter() > self.startTime + (self.deadline - self.startTime) / 2:
+                break
+        result.nodes = self.nodes
+        result.time = time.perf_counter() - self.startTime
+        result.stats = self.collectStats(result)
+        return result
+
+    # the searchStats of the search that just finished, also appended to statsLog if there is one
+    def collectStats(self, result):
+        stats = searchStats()
+        stats.depth = result.depth
+        stats.time = time.perf_counter() - self.startTime
+        stats.nodes = self.nodes
+        stats.quiescenceNodes = self.quiescenceNodes
+        stats.leafEvaluations = self.leafEvaluations
+        stats.betaCutoffs = self.betaCutoffs
+        stats.firstMoveCutoffs = self.firstMoveCutoffs
+        stats.ttProbes = self.tt.probes - self.ttProbesStart
+        stats.ttHits = self.tt.hits - self.ttHitsStart
+        stats.moveGenerations = self.moveGenerations
+        stats.moveGenerationTime = self.moveGenerationTime
+        stats.evaluationTime = self.evaluationTime
+        stats.nullMoveCutoffs = self.nullMoveCutoffs
+        stats.reductions = self.reductions
+        stats.reductionReSearches = self.reductionReSearches
+        stats.pvsReSearches = self.pvsReSearches
+        stats.checkExtensions = self.extensions
+        stats.aspirationFailHighs = self.aspirationFailHighs
+        stats.aspirationFailLows = self.aspirationFailLows
+        stats.iterationNodes = self.iterationNodes
+        if self.perDepthStats:
+            stats.depths = self.depths
+        if statsLog is not None:
+            with open(statsLog, 'a') as f:
+                f.write(stats.toJSON() + "\n")
+        return stats
+
+    # resets the counters, budget and ordering tables for a new search
+    def startSearch(self, timeLimit=None, nodeLimit=None):
+        self.startTime = time.perf_counter()
+        self.deadline = self.startTime + timeLimit if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        self.nodes = 0
+        self.quiescenceNodes = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0 # cutoffs caused by the first move tried, a measure of ordering quality
+        self.leafEvaluations = 0
+        self.moveGenerations = 0
+        self.moveGenerationTime = 0.0
+        self.evaluationTime = 0.0
+        self.nullMoveCutoffs = 0
+        self.reductions = 0
+        self.reductionReSearches = 0
+        self.pvsReSearches = 0
+        self.extensions = 0 # checkExtensions is the switch
+        self.aspirationFailHighs = 0
+        self.aspirationFailLows = 0
+        self.iterationNodes = []
+        self.depths = []
+        self.ttProbesStart = self.tt.probes # the table's counters run on over searches
+        self.ttHitsStart = self.tt.hits
+        self.nextCheck = self.checkEvery
+        self.pv = []
+        self.rootDepth = 0
+        self.killers = [[0, 0] for ply in range(2 * MAX_DEPTH + 1)] # two quiet moves per ply that caused cutoffs (check extensions can take a line to twice the depth)
+        self.history = [0] * 8192 # cutoff counts of quiet moves, indexed by moveID
+        self.tt.newSearch()
+
+    # score of one move at the root searched depth plies deep (the move included) with the given window,
+    # for splitting the root moves between processes (see chessParallel.rootSplitSearch)
+    # the score is exact if it is between alpha and beta, otherwise it only bounds the move's score
+    def searchRootMove(self, gs, move, depth, alpha, beta=CHECKMATE):
+        self.canAbort = False
+        self.previousPv = []
+        self.followPv = False
+        self.rootDepth = depth
+        turnMultiplier = 1 if gs.whiteTurn else -1
         gs.makeMove(move)
         nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
+        score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth-1, -beta, -alpha, -turnMultiplier, 1, gs.sideInCheck)
         gs.undo()
-        if maxScore > alpha: # pruning phase
-            alpha = maxScore
-        if alpha >= beta:
-            break
-    return maxScore
+        self.pv = [move] + self.pv
+        return score
+
+    # keeps searching captures (and promotions) past the nominal depth until the position is quiet,
+    # so a leaf in the middle of an exchange isn't scored as if the exchange was over
+    def quiescenceSearch(self, gs, alpha, beta, turnMultiplier, ply, quiescencePly):
+        self.nodes += 1
+        self.quiescenceNodes += 1
+        if self.nodes >= self.nextCheck:
+            self.checkBudget()
+        self.pv = []
+
+        if quiescencePly < QUIESCENCE_EVASION_PLIES and gs.inCheck():
+            # standing pat isn't an option in check, every evasion gets searched
+            start = clock()
+            moves = gs.getValidMoves()
+            self.moveGenerationTime += clock() - start
+            self.moveGenerations += 1
+            if len(moves) == 0:
+                return -CHECKMATE + ply
+            standPat = -CHECKMATE
+            maxScore = -CHECKMATE
+            evading = True
+        else:
+            # the side to move can usually do at least as well as the current score by not capturing
+            start = clock()
+            standPat = turnMultiplier * gs.getEvaluation()
+            self.evaluationTime += clock() - start
+            self.leafEvaluations += 1
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            start = clock()
+            moves = gs.getCaptureMoves()
+            self.moveGenerationTime += clock() - start
+            self.moveGenerations += 1
+            maxScore = standPat
+            evading = False
+
+        if len(moves) > 1:
+            moves.sort(key=lambda move: pieceScore[move.pieceMoved[1]] - 100 * pieceScore[move.pieceCaptured[1]] if move.pieceCaptured != '--' else 0)
+        for move in moves:
+            if not evading:
+                # delta pruning: even winning the captured piece for free can't raise alpha
+                # (the most the capture could score still counts, so the fail soft result stays a true bound)
+                gain = pieceScore[move.pieceCaptured[1]] if move.pieceCaptured != '--' else 0
+                if move.isPawnPromotion:
+                    gain += pieceScore['Q'] - pieceScore['P']
+                if standPat + gain + DELTA_MARGIN <= alpha:
+                    if standPat + gain + DELTA_MARGIN > maxScore:
+                        maxScore = standPat + gain + DELTA_MARGIN
+                    continue
+            gs.makeMove(move)
+            score = -self.quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, ply+1, quiescencePly+1)
+            gs.undo()
+            if score > maxScore:
+                maxScore = score
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                break
+        self.pv = []
+        return maxScore
+
+    # yields the moves one stage at a time, so a cutoff early on skips sorting the later stages:
+    # hash/pv move, captures (most valuable victim first, then least valuable attacker), promotions,
+    # killer moves for this ply, then the remaining quiet moves by history score
+    def orderMoves(self, validMoves, ply, firstMoveID):
+        captures = []
+        promotions = []
+        quiets = []
+        firstMove = None
+        for move in validMoves:
+            if move.moveID == firstMoveID:
+                firstMove = move
+            elif move.pieceCaptured != '--':
+                captures.append(move)
+            elif move.isPawnPromotion:
+                promotions.append(move)
+            else:
+                quiets.append(move)
+        if firstMove is not None:
+            yield firstMove
+
+        if len(captures) > 1:
+            captures.sort(key=lambda move: pieceScore[move.pieceMoved[1]] - 100 * pieceScore[move.pieceCaptured[1]])
+        for move in captures:
+            yield move
+        for move in promotions:
+            yield move
+
+        killers = self.killers[ply]
+        for killerID in killers:
+            for i in range(len(quiets)):
+                if quiets[i].moveID == killerID:
+                    yield quiets.pop(i)
+                    break
+
+        history = self.history
+        quiets.sort(key=lambda move: -history[move.moveID])
+        for move in quiets:
+            yield move
+
+    # a line cut short by a transposition table hit is continued with the stored best moves
+    def extendPv(self, gs, pv, length):
+        pv = list(pv)
+        for move in pv:
+            gs.makeMove(move)
+        while len(pv) < length:
+            entry = self.tt.probe(gs.zobristHash)
+            if entry is None or entry[3] == 0:
+                break
+            nextMove = None
+            for move in gs.getValidMoves():
+                if move.moveID == entry[3]:
+                    nextMove = move
+                    break
+            if nextMove is None:
+                break
+            pv.append(nextMove)
+            gs.makeMove(nextMove)
+        for i in range(len(pv)):
+            gs.undo()
+        return pv
+
+    def checkBudget(self):
+        self.nextCheck = self.nodes + self.checkEvery
+        if not self.canAbort:
+            return
+        if self.isStopped():
+            raise searchAborted()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise searchAborted()
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            raise searchAborted()
+
+    # returns the score of the position for the side to move and leaves the principal variation
+    # from here in self.pv
+    # inCheck is whether the side to move is in check, looked up here if the caller doesn't know
+    def findMoveNegaMaxAlphaBeta(self, gs, validMoves, depth, alpha, beta, turnMultiplier, ply, inCheck=None):
+        self.nodes += 1
+        if self.nodes >= self.nextCheck:
+            self.checkBudget()
+        self.pv = []
+        onPv = self.followPv and ply < len(self.previousPv) # still on the previous iteration's best line
+        self.followPv = False
+        if len(validMoves) == 0:
+            return -CHECKMATE + ply if gs.checkMate else STALEMATE # quicker mates score higher
+        if self.tablebases and ply > 0 and chessBitboards.popCount(gs.colorBitboards['w'] | gs.colorBitboards['b']) <= chessTablebase.MAX_PIECES:
+            value = chessTablebase.probe(gs)
+            if value is not None:
+                return tablebaseScore(value, ply)
+        if depth == 0:
+            if self.quiescence:
+                return self.quiescenceSearch(gs, alpha, beta, turnMultiplier, ply, 0)
+            start = clock()
+            score = turnMultiplier * scoreBoard(gs)
+            self.evaluationTime += clock() - start
+            self.leafEvaluations += 1
+            return score
+
+        # transposition table: a deep enough earlier search of this position can end this one,
+        # otherwise its best move is tried first
+        # with pvs the full window nodes are the re-searches of moves a zero window search found better, and
+        # a bound from that zero window search would only narrow the re-search back to it, so they search
+        # their own window (and keep their principal variation)
+        tt = self.tt
+        pvNode = self.pvs and beta - alpha > 2 * NULL_WINDOW
+        hashMoveID = 0
+        entry = tt.probe(gs.zobristHash)
+        if entry is not None:
+            entryDepth, entryFlag, entryScore, hashMoveID = entry
+            entryScore = scoreFromTT(entryScore, ply)
+            if entryDepth >= depth and ply > 0 and not pvNode: # the root still has to pick a move
+                if entryFlag == chessTranspositionTable.exact:
+                    return entryScore
+                elif entryFlag == chessTranspositionTable.lowerBound:
+                    alpha = max(alpha, entryScore)
+                else:
+                    beta = min(beta, entryScore)
+                if alpha >= beta:
+                    return entryScore
+        alphaOriginal = alpha # the bounds the stored flag is decided on, after the table narrowed them
+
+        # null move pruning: if passing the turn still scores at least beta in a shallower search, some move
+        # would too. Not in check, never twice in a row, and not with only king and pawns left, where
+        # having to move can be the worst thing there is (zugzwang)
+        if inCheck is None:
+            inCheck = gs.inCheck()
+        if (self.nullMove and ply > 0 and depth > NULL_MOVE_REDUCTION and not inCheck and gs.moveLog[-1] is not None
+                and abs(beta) < MATE_SCORE):
+            color = 'w' if gs.whiteTurn else 'b'
+            bitboards = gs.bitboards
+            if (bitboards[color+'N'] | bitboards[color+'B'] | bitboards[color+'R'] | bitboards[color+'Q']) and turnMultiplier * gs.getEvaluation() >= beta:
+                gs.makeNullMove()
+                start = clock()
+                nullMoves = gs.getValidMoves()
+                self.moveGenerationTime += clock() - start
+                self.moveGenerations += 1
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nullMoves, depth-1-NULL_MOVE_REDUCTION, -beta, -beta+NULL_WINDOW, -turnMultiplier, ply+1, False)
+                gs.undoNullMove()
+                if score >= beta:
+                    self.nullMoveCutoffs += 1
+                    return beta if score >= MATE_SCORE else score # a mate found after passing proves nothing
+
+        # move ordering - the previous iteration's principal variation while still on it, otherwise the
+        # hash move, then the rest in stages (see orderMoves)
+        firstMoveID = self.previousPv[ply].moveID if onPv else hashMoveID
+        if self.moveOrdering:
+            orderedMoves = self.orderMoves(validMoves, ply, firstMoveID)
+        else:
+            orderedMoves = validMoves
+            if firstMoveID:
+                for i in range(len(validMoves)):
+                    if validMoves[i].moveID == firstMoveID:
+                        orderedMoves = [validMoves[i]] + validMoves[:i] + validMoves[i+1:]
+                        break
+
+        maxScore = -CHECKMATE
+        bestMove = None
+        bestPv = []
+        movesTried = 0
+        for move in orderedMoves:
+            movesTried += 1
+            self.followPv = onPv and move.moveID == firstMoveID
+            gs.makeMove(move)
+            start = clock()
+            nextMoves = gs.getValidMoves()
+            self.moveGenerationTime += clock() - start
+            self.moveGenerations += 1
+            givesCheck = gs.sideInCheck
+            newDepth = depth - 1
+            if givesCheck and self.checkExtensions and ply + depth < 2 * self.rootDepth:
+                newDepth += 1
+                self.extensions += 1
+            if movesTried == 1 or not (self.pvs or self.lateMoveReductions):
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, newDepth, -beta, -alpha, -turnMultiplier, ply+1, givesCheck)
+            else:
+                # late move reductions: a quiet move this far down the ordering is unlikely to be best,
+                # so it is searched a ply shallower and only searched again to full depth if it beats alpha
+                reduction = 0
+                if (self.lateMoveReductions and movesTried > LMR_MOVES and depth >= LMR_DEPTH and not inCheck and not givesCheck
+                        and move.pieceCaptured == '--' and not move.isPawnPromotion):
+                    reduction = 1
+                    self.reductions += 1
+                # principal variation search: the moves after the first only have to be shown no better than
+                # alpha, which a zero window does more cheaply, and are searched again if they turn out better
+                windowAlpha = -alpha - NULL_WINDOW if self.pvs else -beta
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, newDepth-reduction, windowAlpha, -alpha, -turnMultiplier, ply+1, givesCheck)
+                if reduction and score > alpha:
+                    self.reductionReSearches += 1
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, newDepth, windowAlpha, -alpha, -turnMultiplier, ply+1, givesCheck)
+                if pvNode and alpha < score < beta:
+                    self.pvsReSearches += 1
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, newDepth, -beta, -alpha, -turnMultiplier, ply+1, givesCheck)
+            gs.undo()
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+                bestPv = [move] + self.pv
+            if maxScore > alpha: # pruning phase
+                alpha = maxScore
+            if alpha >= beta:
+                self.betaCutoffs += 1
+                if movesTried == 1:
+                    self.firstMoveCutoffs += 1
+                if move.pieceCaptured == '--' and not move.isPawnPromotion: # remember quiet moves that cut off
+                    killers = self.killers[ply]
+                    if killers[0] != move.moveID:
+                        killers[1] = killers[0]
+                        killers[0] = move.moveID
+                    self.history[move.moveID] += depth * depth
+                break
+
+        if maxScore <= alphaOriginal:
+            flag = chessTranspositionTable.upperBound
+        elif maxScore >= beta:
+            flag = chessTranspositionTable.lowerBound
+        else:
+            flag = chessTranspositionTable.exact
+        tt.store(gs.zobristHash, depth, flag, scoreToTT(maxScore, ply), bestMove.moveID)
+        self.pv = bestPv
+        return maxScore
+
+# mate scores count plies from the root, the table stores them counted from the position itself
+def scoreToTT(score, ply):
+    if score >= MATE_SCORE:
+        return score + ply
+    if score <= -MATE_SCORE:
+        return score - ply
+    return score
+
+def scoreFromTT(score, ply):
+    if score >= MATE_SCORE:
+        return score - ply
+    if score <= -MATE_SCORE:
+        return score + ply
+    return score
+
+# search score of a stored tablebase value, mates counted from the root like the search's own
+def tablebaseScore(value, ply):
+    if value > 0:
+        return CHECKMATE - ply - value
+    if value < 0:
+        return -CHECKMATE + ply - value - 1
+    return STALEMATE
 
 # more advanced way of scoring board
 # a positive score is good for white, negative score good for black
+# material and piece square scores are running totals kept by the game state, so this is O(1)
 def scoreBoard(gs):
     if gs.checkMate:
         if gs.whiteTurn:
@@ -115,15 +751,7 @@ def scoreBoard(gs):
             return CHECKMATE # white wins
     elif gs.staleMate:
         return STALEMATE
-    
-    score = 0
-    for row in gs.board:
-        for square in row:
-            if square[0] == 'w':
-                score += pieceScore[square[1]]
-            elif square[0] == 'b':
-                score -= pieceScore[square[1]]
-    return score
+    return gs.getEvaluation()
 
 # score the board based on material
 def scoreMaterial(board):
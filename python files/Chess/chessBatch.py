@@ -0,0 +1,212 @@
+# analyses a file of positions without the pygame window
+# reads FEN or EPD lines one at a time, searches them on a pool of processes and writes one JSON line
+# per position as soon as it (and every position before it) is done, so memory use stays the same
+# however long the file is and the output can be picked up again after a crash
+# run from the Chess folder:
+#   python chessBatch.py positions.epd -o results.jsonl -d 4 -w 8
+#   python chessBatch.py positions.epd -o results.jsonl --resume    carry on after the last written line
+#   python chessBatch.py - --evaluate < positions.fen                 static evaluation only, to stdout
+#                                                                     (in batches with chessNumpy when numpy is installed)
+#   python chessBatch.py positions.epd -d 4 --stats                    add the search statistics to every line
+#
+# every output line has the input line number and "next", the byte offset of the line after it,
+# which is where --resume (or --offset) starts reading again
+
+import argparse, collections, json, os, sys, time
+from concurrent.futures import ProcessPoolExecutor
+import chessEngine, chessAI, chessNumpy
+
+EVALUATE_BATCH = 1024 # positions --evaluate scores per chessNumpy.evaluateBatch call
+
+# splits an EPD/FEN line into the FEN and the EPD operations (opcode -> operand string)
+# a FEN keeps its move counters, the operations are whatever follows the first four fields otherwise
+def parsePositionLine(text):
+    fields = text.split()
+    if len(fields) < 4:
+        raise ValueError("need at least 4 FEN fields")
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return " ".join(fields[:6]), {}
+    fen = " ".join(fields[:4])
+    operations = {}
+    for operation in " ".join(fields[4:]).split(';'):
+        operation = operation.strip()
+        if operation:
+            opcode, _, operand = operation.partition(' ')
+            operations[opcode] = operand.strip().strip('"')
+    return fen, operations
+
+# searches (or just evaluates) one position, runs in the pool processes
+# returns the JSON record without the line bookkeeping
+def analysePosition(text, depth, timeLimit, nodeLimit, evaluateOnly, stats=False):
+    gs, record = readPosition(text)
+    if gs is None:
+        return record
+    start = time.perf_counter()
+    if evaluateOnly:
+        record["score"] = (1 if gs.whiteTurn else -1) * chessAI.scoreBoard(gs) # side to move, like the search scores
+        record["time"] = round(time.perf_counter() - start, 6)
+        return record
+    validMoves = gs.getValidMoves()
+    result = chessAI.search(gs, validMoves, depth, timeLimit, nodeLimit)
+    record["bestMove"] = result.bestMove.getChessNotation() if result.bestMove is not None else None
+    record["score"] = result.score # from the side to move's point of view
+    record["depth"] = result.depth
+    record["nodes"] = result.nodes
+    record["time"] = round(result.time, 6)
+    record["pv"] = [move.getChessNotation() for move in result.pv]
+    if stats:
+        record["stats"] = result.stats.toDict()
+    if gs.checkMate or gs.staleMate:
+        record["result"] = "checkmate" if gs.checkMate else "stalemate"
+    return record
+
+# (game state, record with the fen and passed through operations) for a position line,
+# (None, error record) if it can't be read
+def readPosition(text):
+    try:
+        fen, operations = parsePositionLine(text)
+        gs = chessEngine.gameState.fromFEN(fen)
+    except (ValueError, KeyError, IndexError) as error:
+        return None, {"input": text, "error": "bad position: " + str(error)}
+    record = {"fen": fen}
+    for opcode in ("id", "bm"): # EPD name and expected best move are passed through
+        if opcode in operations:
+            record[opcode] = operations[opcode]
+    return gs, record
+
+# static evaluations of positions from readPositions, batchSize at a time in one chessNumpy.evaluateBatch
+# call (without its mobility term, so the scores are the ones analysePosition gives); needs numpy
+# yields the records in input order, time is each position's share of its batch
+def evaluatePositions(positions, batchSize=EVALUATE_BATCH):
+    batch = []
+    for position in positions:
+        batch.append(position)
+        if len(batch) == batchSize:
+            yield from evaluateChunk(batch)
+            batch = []
+    if batch:
+        yield from evaluateChunk(batch)
+
+def evaluateChunk(batch):
+    start = time.perf_counter()
+    read = [readPosition(text) for lineNumber, offset, text in batch]
+    gameStates = [gs for gs, record in read if gs is not None]
+    scores = chessNumpy.evaluateBatch(chessNumpy.stackPlanes(gameStates), 0) if gameStates else []
+    share = round((time.perf_counter() - start) / len(batch), 6)
+    i = 0
+    for (lineNumber, offset, text), (gs, record) in zip(batch, read):
+        if gs is not None:
+            record["score"] = round((1 if gs.whiteTurn else -1) * float(scores[i]), 6) # side to move, like the search scores
+            record["time"] = share
+            i += 1
+        yield dict(line=lineNumber, next=offset, **record)
+
+# yields (line number, byte offset after the line, text) for every position line of a binary stream
+# blank lines and lines starting with # are skipped but still counted
+def readPositions(stream, lineNumber=0, offset=0):
+    for raw in stream:
+        lineNumber += 1
+        offset += len(raw)
+        text = raw.decode("utf-8", "replace").strip()
+        if text and not text.startswith('#'):
+            yield lineNumber, offset, text
+
+# analyses positions from readPositions and yields the finished records in input order
+# with workers > 1 at most maxPending positions are in the pool at once
+# evaluations alone are done in batches here (no pool) when numpy is installed
+def analysePositions(positions, depth=None, timeLimit=None, nodeLimit=None, workers=1, evaluateOnly=False, maxPending=None,
+                     stats=False):
+    if evaluateOnly and chessNumpy.np is not None:
+        yield from evaluatePositions(positions)
+        return
+    if workers <= 1:
+        for lineNumber, offset, text in positions:
+            yield dict(line=lineNumber, next=offset, **analysePosition(text, depth, timeLimit, nodeLimit, evaluateOnly, stats))
+        return
+    maxPending = maxPending or 4 * workers
+    pending = collections.deque()
+    with ProcessPoolExecutor(workers) as pool:
+        for lineNumber, offset, text in positions:
+            pending.append((lineNumber, offset, pool.submit(analysePosition, text, depth, timeLimit, nodeLimit, evaluateOnly, stats)))
+            if len(pending) >= maxPending:
+                lineNumber, offset, task = pending.popleft()
+                yield dict(line=lineNumber, next=offset, **task.result())
+        while pending:
+            lineNumber, offset, task = pending.popleft()
+            yield dict(line=lineNumber, next=offset, **task.result())
+
+# line number and input offset to carry on from, read off the last record of an earlier output file
+# a last line that isn't a whole record (a run killed while writing it) is cut off the file, so the
+# position it was for is analysed again
+def resumePoint(outputPath):
+    if not os.path.exists(outputPath):
+        return 0, 0
+    with open(outputPath, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        block = 4096
+        while end > 0:
+            # only the end of the file is read, however big it is
+            start = max(0, end - block)
+            f.seek(start)
+            tail = f.read(end - start)
+            cut = tail.rfind(b'\n', 0, len(tail) - 1) # end of the line before the last one
+            if cut < 0 and start > 0:
+                block *= 2 # the last line didn't fit, read more
+                continue
+            line = tail[cut + 1:]
+            if line.endswith(b'\n'):
+                try:
+                    last = json.loads(line)
+                    return last["line"], last["next"]
+                except (ValueError, KeyError, TypeError):
+                    pass
+            end = start + cut + 1
+            f.truncate(end)
+    return 0, 0
+
+def analyseFile(inputPath, outputPath=None, depth=None, timeLimit=None, nodeLimit=None, workers=1,
+                evaluateOnly=False, offset=0, lineNumber=0, resume=False, stats=False):
+    if resume:
+        if outputPath is None:
+            raise ValueError("--resume needs an output file")
+        lineNumber, offset = resumePoint(outputPath)
+    if inputPath == '-':
+        if offset:
+            raise ValueError("can't skip ahead in standard input")
+        inputStream = sys.stdin.buffer
+    else:
+        inputStream = open(inputPath, 'rb')
+        inputStream.seek(offset)
+    output = open(outputPath, 'a') if outputPath is not None else sys.stdout
+    count = 0
+    start = time.perf_counter()
+    try:
+        for record in analysePositions(readPositions(inputStream, lineNumber, offset), depth, timeLimit, nodeLimit,
+                                       workers, evaluateOnly, stats=stats):
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            count += 1
+    finally:
+        if inputStream is not sys.stdin.buffer:
+            inputStream.close()
+        if output is not sys.stdout:
+            output.close()
+    return count, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="analyse FEN/EPD positions and write JSON lines")
+    parser.add_argument("input", help="FEN or EPD file, - for standard input")
+    parser.add_argument("-o", "--output", help="JSON lines file to append to (standard output if not given)")
+    parser.add_argument("-d", "--depth", type=int, help="search depth (default chessAI.DEPTH, or unlimited with a budget)")
+    parser.add_argument("-t", "--time", type=float, help="seconds per position")
+    parser.add_argument("-n", "--nodes", type=int, help="nodes per position")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="processes (default: one per core)")
+    parser.add_argument("--evaluate", action="store_true", help="static evaluation only, no search")
+    parser.add_argument("--offset", type=int, default=0, help="byte offset in the input to start at")
+    parser.add_argument("--line", type=int, default=0, help="line number of the line before --offset")
+    parser.add_argument("--resume", action="store_true", help="start after the last line already in the output file")
+    parser.add_argument("--stats", action="store_true", help="add the search statistics (chessAI.searchStats) to every line")
+    args = parser.parse_args()
+    count, elapsed = analyseFile(args.input, args.output, args.depth, args.time, args.nodes, args.workers,
+                                 args.evaluate, args.offset, args.line, args.resume, args.stats)
+    print("%d positions in %.1fs" % (count, elapsed), file=sys.stderr)
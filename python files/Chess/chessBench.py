@@ -0,0 +1,115 @@
+# benchmarks for the engine and the AI on a fixed set of positions
+# run from the Chess folder: python chessBench.py [depth]
+# parallel search speedup: python chessBench.py parallel [depth] [most workers]
+# root splitting speedup: python chessBench.py rootsplit [depth] [most workers]
+# pruning, extensions and aspiration windows one at a time: python chessBench.py pruning [depth]
+
+import sys, time, multiprocessing
+import chessEngine, chessAI, chessTranspositionTable, chessParallel
+
+# positions reached by playing these moves from the start (coordinate notation)
+benchmarkPositions = {
+    "ruy lopez": "e2e4 e7e5 g1f3 b8c6 f1b5 a7a6 b5a4 g8f6 e1g1 f8e7",
+    "sicilian": "e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6",
+    "queens gambit": "d2d4 d7d5 c2c4 e7e6 b1c3 g8f6 c1g5 f8e7 e2e3 e8g8",
+    "italian": "e2e4 e7e5 g1f3 b8c6 f1c4 f8c5 c2c3 g8f6 d2d4 e5d4 c3d4 c5b4",
+    "french": "e2e4 e7e6 d2d4 d7d5 b1c3 f8b4 e4e5 c7c5 a2a3 b4c3 b2c3 g8e7",
+    "kings indian": "d2d4 g8f6 c2c4 g7g6 b1c3 f8g7 e2e4 d7d6 g1f3 e8g8 f1e2 e7e5",
+}
+
+# plays the moves (coordinate notation like "e2e4") on the game state
+def playMoves(gs, moves):
+    for notation in moves.split():
+        for move in gs.getValidMoves():
+            if move.getChessNotation() == notation:
+                gs.makeMove(move)
+                break
+        else:
+            raise ValueError("illegal move " + notation)
+    return gs
+
+def benchmarkGameStates():
+    return {name: playMoves(chessEngine.gameState(), moves) for name, moves in benchmarkPositions.items()}
+
+# searches every position to a fixed depth with and without move ordering and compares node counts
+def benchmarkMoveOrdering(depth=3):
+    print("%-16s %10s %10s %8s %12s" % ("position", "unordered", "ordered", "saved", "first cut %"))
+    totals = [0, 0]
+    for name, gs in benchmarkGameStates().items():
+        nodes = []
+        for ordering in (False, True):
+            s = chessAI.searcher(chessTranspositionTable.transpositionTable(16), moveOrdering=ordering)
+            s.search(gs, gs.getValidMoves(), depth)
+            nodes.append(s.nodes)
+        firstCut = 100 * s.firstMoveCutoffs / s.betaCutoffs if s.betaCutoffs else 0
+        totals[0] += nodes[0]
+        totals[1] += nodes[1]
+        print("%-16s %10d %10d %7.1f%% %12.1f" % (name, nodes[0], nodes[1], 100 - 100 * nodes[1] / nodes[0], firstCut))
+    print("%-16s %10d %10d %7.1f%%" % ("total", totals[0], totals[1], 100 - 100 * totals[1] / totals[0]))
+
+# searcher switches compared by benchmarkPruning, each one is turned on by itself
+searchFeatures = ["pvs", "nullMove", "lateMoveReductions", "checkExtensions", "aspiration"]
+
+# searches every position to a fixed depth with none of the searchFeatures, with each one on its own
+# and with all of them, and prints the node counts and what each saves over none
+def benchmarkPruning(depth=4):
+    columns = ["none"] + searchFeatures + ["all"]
+    print("%-16s" % "position" + "".join("%19s" % column for column in columns))
+    totals = [0] * len(columns)
+    for name, gs in benchmarkGameStates().items():
+        nodes = []
+        for column in columns:
+            switches = {feature: column in (feature, "all") for feature in searchFeatures}
+            s = chessAI.searcher(chessTranspositionTable.transpositionTable(16), **switches)
+            s.search(gs, gs.getValidMoves(), depth)
+            nodes.append(s.nodes)
+        totals = [total + count for total, count in zip(totals, nodes)]
+        print("%-16s" % name + "".join("%10d (%+5.1f%%)" % (count, 100 * count / nodes[0] - 100) for count in nodes))
+    print("%-16s" % "total" + "".join("%10d (%+5.1f%%)" % (count, 100 * count / totals[0] - 100) for count in totals))
+
+# times a fixed depth search of every position with 1, 2, 4, ... worker processes
+# (each run starts from an empty table) and reports the speedup over chessAI's single process search,
+# so the work splitting adds (1 worker) shows as well as what the extra workers win back
+# rootSplit times chessParallel.rootSplitSearch instead of the lazy SMP search
+def benchmarkParallel(depth=4, maxWorkers=None, rootSplit=False):
+    maxWorkers = maxWorkers or multiprocessing.cpu_count()
+    workerCounts = [1]
+    while workerCounts[-1] * 2 <= maxWorkers:
+        workerCounts.append(workerCounts[-1] * 2)
+    if workerCounts[-1] != maxWorkers:
+        workerCounts.append(maxWorkers)
+    print("%d cores, depth %d, %s" % (multiprocessing.cpu_count(), depth, "root splitting" if rootSplit else "lazy SMP"))
+    print("%-8s %10s %12s %8s" % ("workers", "time", "nodes", "speedup"))
+    gameStates = benchmarkGameStates()
+    baseTime = 0
+    nodes = 0
+    for gs in gameStates.values():
+        start = time.perf_counter()
+        result = chessAI.searcher(chessTranspositionTable.transpositionTable(chessAI.hashSizeMB)).search(gs, gs.getValidMoves(), depth)
+        baseTime += time.perf_counter() - start
+        nodes += result.nodes
+    print("%-8s %9.2fs %12d %7.2fx" % ("serial", baseTime, nodes, 1))
+    for workers in workerCounts:
+        elapsed = 0
+        nodes = 0
+        for gs in gameStates.values():
+            chessParallel.getSharedTable().clear()
+            start = time.perf_counter()
+            if rootSplit:
+                result = chessParallel.rootSplitSearch(gs, gs.getValidMoves(), depth, workers)
+            else:
+                result = chessParallel.search(gs, gs.getValidMoves(), depth, workers=workers)
+            elapsed += time.perf_counter() - start
+            nodes += result.nodes
+        print("%-8d %9.2fs %12d %7.2fx" % (workers, elapsed, nodes, baseTime / elapsed))
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    if len(sys.argv) > 1 and sys.argv[1] in ("parallel", "rootsplit"):
+        benchmarkParallel(int(sys.argv[2]) if len(sys.argv) > 2 else 4, int(sys.argv[3]) if len(sys.argv) > 3 else None,
+                          sys.argv[1] == "rootsplit")
+    elif len(sys.argv) > 1 and sys.argv[1] == "pruning":
+        benchmarkPruning(int(sys.argv[2]) if len(sys.argv) > 2 else 4)
+    else:
+        benchmarkMoveOrdering(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
+    print("time %.1fs" % (time.perf_counter() - start))
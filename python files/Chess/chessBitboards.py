@@ -0,0 +1,128 @@
+# bitboard tables and attack lookups used by the bitboard backend in chessEngine
+# a bitboard is a 64 bit int with one bit per square
+# square index is row*8 + col, so bit 0 is a8 and bit 63 is h1 (same layout as gameState.board)
+
+FULL = (1 << 64) - 1
+squareBits = [1 << sq for sq in range(64)]
+squareCoords = [(sq // 8, sq % 8) for sq in range(64)] # square index -> (row, col)
+
+def onBoard(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+# builds a list (one entry per square) of squares reached by single steps in the given order
+def stepTargets(steps):
+    targets = []
+    for sq in range(64):
+        r, c = squareCoords[sq]
+        targets.append([(r+dr)*8 + (c+dc) for dr, dc in steps if onBoard(r+dr, c+dc)])
+    return targets
+
+def toMask(squares):
+    mask = 0
+    for sq in squares:
+        mask |= squareBits[sq]
+    return mask
+
+# step orders match the hand written generators in chessEngine so move lists come out in the same order
+knightSteps = [(1, 2), (1, -2), (2, 1), (2, -1), (-1, 2), (-1, -2), (-2, 1), (-2, -1)]
+kingSteps = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+
+knightTargets = stepTargets(knightSteps)
+kingTargets = stepTargets(kingSteps)
+knightAttacks = [toMask(t) for t in knightTargets]
+kingAttacks = [toMask(t) for t in kingTargets]
+
+# squares a pawn of each color on sq attacks, left capture first (index 0 white, 1 black)
+pawnCaptureTargets = [stepTargets([(-1, -1), (-1, 1)]), stepTargets([(1, -1), (1, 1)])]
+pawnAttacks = [[toMask(t) for t in targets] for targets in pawnCaptureTargets]
+
+# squares attacked by a whole set of pawns at once
+notFileA = FULL ^ toMask(range(0, 64, 8))
+notFileH = FULL ^ toMask(range(7, 64, 8))
+
+def pawnAttackMap(pawns, white):
+    if white:
+        return ((pawns & notFileA) >> 9) | ((pawns & notFileH) >> 7)
+    return (((pawns & notFileA) << 7) | ((pawns & notFileH) << 9)) & FULL
+
+# rays in every direction, used for the sliding piece lookups
+down, downRight, right, upRight, up, upLeft, left, downLeft = range(8)
+directions = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+
+def buildRays():
+    rays = []
+    for dr, dc in directions:
+        dirRays = []
+        for sq in range(64):
+            r, c = squareCoords[sq]
+            squares = []
+            i = 1
+            while onBoard(r + dr*i, c + dc*i):
+                squares.append((r + dr*i)*8 + c + dc*i)
+                i += 1
+            dirRays.append(squares)
+        rays.append(dirRays)
+    return rays
+
+raySquares = buildRays() # raySquares[direction][sq] -> squares in walking order
+rays = [[toMask(squares) for squares in dirRays] for dirRays in raySquares]
+
+# directions that walk towards higher square indexes find their first blocker with the lowest set bit,
+# the others with the highest set bit
+positiveDirections = (down, downRight, right, downLeft)
+negativeDirections = (up, upLeft, left, upRight)
+
+def slidingAttacks(sq, occupied, dirs):
+    attacks = 0
+    for d in dirs:
+        ray = rays[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            if d in positiveDirections:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= rays[d][first]
+        attacks |= ray
+    return attacks
+
+rookDirections = (down, right, up, left)
+bishopDirections = (upRight, upLeft, downLeft, downRight)
+queenDirections = (down, downRight, right, upRight, up, upLeft, left, downLeft)
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, rookDirections)
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, bishopDirections)
+
+def queenAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, queenDirections)
+
+# squares of a slider listed nearest first, cycling through the directions the same way
+# the hand written generators do (so attack masks can be turned into ordered move lists)
+def sliderOrder(dirs):
+    order = []
+    for sq in range(64):
+        squares = []
+        for i in range(7):
+            for d in dirs:
+                if i < len(raySquares[d][sq]):
+                    squares.append(raySquares[d][sq][i])
+        order.append(squares)
+    return order
+
+rookTargets = sliderOrder(rookDirections)
+bishopTargets = sliderOrder(bishopDirections)
+queenTargets = sliderOrder(queenDirections)
+
+# number of set bits (int.bit_count needs python 3.10)
+def popCount(bitboard):
+    return bin(bitboard).count('1')
+
+# yields the index of every set bit, lowest first
+def bitSquares(bitboard):
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
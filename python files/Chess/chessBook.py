@@ -0,0 +1,234 @@
+# opening book: a sorted file of fixed size records, looked up by binary search over a memory map so
+# nothing is read into Python objects at startup and a lookup only touches a few pages of the file
+#
+# records have the Polyglot layout, 16 bytes big endian: key (8), move (2), weight (2), learn (4)
+# the key is chessEngine's own zobrist hash rather than Polyglot's, so books made by other programs
+# won't match - build them again from PGN with buildBook (and do the same if the zobrist keys change)
+# run from the Chess folder:
+#   python chessBook.py openings.pgn -o book.bin --plies 16     build a book from PGN files
+#   python chessBook.py --probe "<FEN>"                         list the book moves of a position
+
+import argparse, mmap, os, random, re, struct, sys
+import chessEngine
+
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "book.bin")
+record = struct.Struct(">QHHI")
+book = None # the book at BOOK_PATH, opened on first use and kept
+
+promotionPieces = {"N": 1, "B": 2, "R": 3, "Q": 4}
+resultWeights = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1)} # (white, black), anything else counts 1 each
+
+class openingBook():
+    def __init__(self, path):
+        self.file = None
+        self.map = None
+        self.count = 0
+        if os.path.exists(path) and os.path.getsize(path) >= record.size:
+            self.file = open(path, 'rb')
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.count = len(self.map) // record.size
+
+    # (move code, weight) of every record for the key, best weight first
+    def entries(self, key):
+        low, high = 0, self.count
+        while low < high: # first record with a key >= key
+            middle = (low + high) // 2
+            if struct.unpack_from(">Q", self.map, middle * record.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.count:
+            entryKey, code, weight, learn = record.unpack_from(self.map, low * record.size)
+            if entryKey != key:
+                break
+            found.append((code, weight))
+            low += 1
+        return found
+
+    # book move for the position picked at random by weight, None if the position isn't in the book
+    def findMove(self, gs, validMoves, rng=random):
+        entries = self.entries(bookKey(gs))
+        if not entries:
+            return None
+        moves = {encodeMove(move): move for move in validMoves}
+        choices = [(moves[code], weight) for code, weight in entries if code in moves and weight > 0]
+        if not choices:
+            return None
+        pick = rng.randrange(sum(weight for move, weight in choices))
+        for move, weight in choices:
+            if pick < weight:
+                return move
+            pick -= weight
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = None
+            self.file = None
+            self.count = 0
+
+def getBook():
+    global book
+    if book is None:
+        book = openingBook(BOOK_PATH)
+    return book
+
+# the zobrist hash without the en passant key when no pawn can take en passant (as Polyglot does),
+# so the position is found whether or not the FEN it came from named the square
+def bookKey(gs):
+    key = gs.zobristHash
+    if gs.enpassantPossible != ():
+        row, col = gs.enpassantPossible
+        pawn = 'wP' if gs.whiteTurn else 'bP'
+        pawnRow = row + 1 if gs.whiteTurn else row - 1
+        if not any(0 <= c < 8 and gs.board[pawnRow][c] == pawn for c in (col - 1, col + 1)):
+            key ^= chessEngine.zobristEnpassant[col]
+    return key
+
+# Polyglot move code: to file and rank, from file and rank (3 bits each, rank 0 is white's back rank),
+# promotion piece above them, castling written as the king taking its own rook
+def encodeMove(move):
+    endCol = move.endCol
+    if move.isCastleMove:
+        endCol = 7 if move.endCol > move.startCol else 0
+    code = endCol | (7 - move.endRow) << 3 | move.startCol << 6 | (7 - move.startRow) << 9
+    if move.isPawnPromotion:
+        code |= promotionPieces[move.promotionChoice] << 12
+    return code
+
+sanPattern = re.compile(r"([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+# the valid move written as san (standard algebraic notation, like Nbd2, exd5, e8=Q+ or O-O)
+def parseSAN(gs, san, validMoves=None):
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        endCol = 6 if len(text) == 3 else 2
+        for move in validMoves:
+            if move.isCastleMove and move.endCol == endCol:
+                return move
+        raise ValueError("illegal move " + san)
+    match = sanPattern.match(text)
+    if match is None:
+        raise ValueError("can't read move " + san)
+    piece, fromFile, fromRank, to, promotion = match.groups()
+    piece = piece or 'P'
+    endRow = chessEngine.Move.ranksToRows[to[1]]
+    endCol = chessEngine.Move.filesToCols[to[0]]
+    found = []
+    for move in validMoves:
+        if move.pieceMoved[1] != piece or move.endRow != endRow or move.endCol != endCol:
+            continue
+        if fromFile is not None and move.startCol != chessEngine.Move.filesToCols[fromFile]:
+            continue
+        if fromRank is not None and move.startRow != chessEngine.Move.ranksToRows[fromRank]:
+            continue
+        if move.isPawnPromotion and move.promotionChoice != (promotion or 'Q'):
+            continue
+        found.append(move)
+    if len(found) != 1:
+        raise ValueError(("ambiguous move " if found else "illegal move ") + san)
+    return found[0]
+
+# yields (tags, list of san moves) for every game of a PGN text stream
+# comments, variations, move numbers and NAGs are left out
+def readGames(stream):
+    tags = {}
+    moveText = []
+    for line in stream:
+        line = line.split(';')[0].strip() # ; starts a comment running to the end of the line
+        if line.startswith('['):
+            if moveText:
+                yield tags, sanMoves(" ".join(moveText))
+                tags = {}
+                moveText = []
+            tag = re.match(r'\[(\w+)\s+"(.*)"\]', line)
+            if tag is not None:
+                tags[tag.group(1)] = tag.group(2)
+        elif line and not line.startswith('%'):
+            moveText.append(line)
+    if moveText or tags:
+        yield tags, sanMoves(" ".join(moveText))
+
+def sanMoves(text):
+    kept = []
+    depth = 0 # inside this many variations
+    comment = None # closing character of the comment being skipped
+    for c in text:
+        if comment is not None:
+            if c == comment:
+                comment = None
+        elif c == '{':
+            comment = '}'
+        elif c == '(':
+            depth += 1
+        elif c == ')':
+            depth -= 1
+        elif depth == 0:
+            kept.append(c)
+    moves = []
+    for word in "".join(kept).split():
+        word = re.sub(r"^\d+\.+", "", word)
+        if word and not word.startswith('$') and word not in ("1-0", "0-1", "1/2-1/2", "*"):
+            moves.append(word)
+    return moves
+
+# compiles the first maxPlies moves of every game in the PGN files into a book at outputPath
+# a move gets 2 for each game its side won and 1 for each draw (or unknown result), moves played
+# in fewer than minGames games are left out; returns the number of games read and of records written
+def buildBook(pgnPaths, outputPath, maxPlies=16, minGames=1):
+    counts = {} # (key, move code) -> [games, weight]
+    games = 0
+    for path in pgnPaths:
+        with open(path, encoding="utf-8", errors="replace") as stream:
+            for tags, moves in readGames(stream):
+                games += 1
+                try:
+                    gs = chessEngine.gameState.fromFEN(tags["FEN"]) if "FEN" in tags else chessEngine.gameState()
+                except ValueError as error:
+                    print("game %d: %s" % (games, error), file=sys.stderr)
+                    continue
+                gs.underPromotions = True
+                white, black = resultWeights.get(tags.get("Result"), (1, 1))
+                for san in moves[:maxPlies]:
+                    try:
+                        move = parseSAN(gs, san)
+                    except ValueError as error:
+                        print("game %d: %s" % (games, error), file=sys.stderr) # the moves before it are kept
+                        break
+                    entry = counts.setdefault((bookKey(gs), encodeMove(move)), [0, 0])
+                    entry[0] += 1
+                    entry[1] += white if gs.whiteTurn else black
+                    gs.makeMove(move)
+
+    entries = [(key, code, weight) for (key, code), (played, weight) in counts.items() if played >= minGames and weight > 0]
+    scale = max([weight for key, code, weight in entries] + [0xffff]) / 0xffff # weights have to fit 16 bits
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+    with open(outputPath, 'wb') as f:
+        for key, code, weight in entries:
+            f.write(record.pack(key, code, max(1, int(weight / scale)), 0))
+    return games, len(entries)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="build or look into an opening book")
+    parser.add_argument("pgn", nargs="*", help="PGN files to build the book from")
+    parser.add_argument("-o", "--output", default=BOOK_PATH, help="book file to write (default: the engine's own book)")
+    parser.add_argument("--plies", type=int, default=16, help="moves of each game to keep, counting both sides")
+    parser.add_argument("--min-games", type=int, default=1, help="leave out moves played in fewer games")
+    parser.add_argument("--probe", metavar="FEN", help="print the book moves of a position instead")
+    parser.add_argument("--book", default=BOOK_PATH, help="book to probe")
+    args = parser.parse_args()
+    if args.probe:
+        gs = chessEngine.gameState.fromFEN(args.probe)
+        gs.underPromotions = True
+        moves = {encodeMove(move): move for move in gs.getValidMoves()}
+        for code, weight in openingBook(args.book).entries(bookKey(gs)):
+            print("%s %d" % (moves[code].getChessNotation() if code in moves else "?%04x" % code, weight))
+    elif args.pgn:
+        games, records = buildBook(args.pgn, args.output, args.plies, args.min_games)
+        print("%d games, %d records written to %s" % (games, records, args.output))
+    else:
+        parser.print_help()
@@ -1,8 +1,116 @@
 # stores all info on current game state
 # determines valid and invalid moves
 
+import random
+import chessBitboards
+
+# zobrist keys, one random 64 bit number per piece on each square plus side to move, castling and en passant
+# the generator is seeded so every process (and anything saved to disk) sees the same hashes
+zobristRandom = random.Random(20240601)
+zobristPieces = {color + piece: [zobristRandom.getrandbits(64) for sq in range(64)] for color in 'wb' for piece in 'PRNBQK'}
+zobristBlackToMove = zobristRandom.getrandbits(64)
+zobristCastleKeys = [zobristRandom.getrandbits(64) for i in range(4)] # wks, wqs, bks, bqs
+zobristCastling = [0] * 16 # one key for every combination of castling rights (see castleRights.getMask)
+for mask in range(16):
+    for i in range(4):
+        if mask & (1 << i):
+            zobristCastling[mask] ^= zobristCastleKeys[i]
+zobristEnpassant = [zobristRandom.getrandbits(64) for col in range(8)] # en passant file
+
+# evaluation terms gameState keeps as running totals (positive is good for white)
+pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "P": 1}
+
+# piece square tables in hundredths of a pawn, from white's side of the board (row 0 is the 8th rank)
+knightScores = [[-50, -40, -30, -30, -30, -30, -40, -50],
+                [-40, -20,   0,   0,   0,   0, -20, -40],
+                [-30,   0,  10,  15,  15,  10,   0, -30],
+                [-30,   5,  15,  20,  20,  15,   5, -30],
+                [-30,   0,  15,  20,  20,  15,   0, -30],
+                [-30,   5,  10,  15,  15,  10,   5, -30],
+                [-40, -20,   0,   5,   5,   0, -20, -40],
+                [-50, -40, -30, -30, -30, -30, -40, -50]]
+
+bishopScores = [[-20, -10, -10, -10, -10, -10, -10, -20],
+                [-10,   0,   0,   0,   0,   0,   0, -10],
+                [-10,   0,   5,  10,  10,   5,   0, -10],
+                [-10,   5,   5,  10,  10,   5,   5, -10],
+                [-10,   0,  10,  10,  10,  10,   0, -10],
+                [-10,  10,  10,  10,  10,  10,  10, -10],
+                [-10,   5,   0,   0,   0,   0,   5, -10],
+                [-20, -10, -10, -10, -10, -10, -10, -20]]
+
+rookScores = [[ 0,  0,  0,  0,  0,  0,  0,  0],
+              [ 5, 10, 10, 10, 10, 10, 10,  5],
+              [-5,  0,  0,  0,  0,  0,  0, -5],
+              [-5,  0,  0,  0,  0,  0,  0, -5],
+              [-5,  0,  0,  0,  0,  0,  0, -5],
+              [-5,  0,  0,  0,  0,  0,  0, -5],
+              [-5,  0,  0,  0,  0,  0,  0, -5],
+              [ 0,  0,  0,  5,  5,  0,  0,  0]]
+
+queenScores = [[-20, -10, -10, -5, -5, -10, -10, -20],
+               [-10,   0,   0,  0,  0,   0,   0, -10],
+               [-10,   0,   5,  5,  5,   5,   0, -10],
+               [ -5,   0,   5,  5,  5,   5,   0,  -5],
+               [  0,   0,   5,  5,  5,   5,   0,  -5],
+               [-10,   5,   5,  5,  5,   5,   0, -10],
+               [-10,   0,   5,  0,  0,   0,   0, -10],
+               [-20, -10, -10, -5, -5, -10, -10, -20]]
+
+kingScores = [[-30, -40, -40, -50, -50, -40, -40, -30],
+              [-30, -40, -40, -50, -50, -40, -40, -30],
+              [-30, -40, -40, -50, -50, -40, -40, -30],
+              [-30, -40, -40, -50, -50, -40, -40, -30],
+              [-20, -30, -30, -40, -40, -30, -30, -20],
+              [-10, -20, -20, -20, -20, -20, -20, -10],
+              [ 20,  20,   0,   0,   0,   0,  20,  20],
+              [ 20,  30,  10,   0,   0,  10,  30,  20]]
+
+pawnScores = [[ 0,  0,   0,   0,   0,   0,  0,  0],
+              [50, 50,  50,  50,  50,  50, 50, 50],
+              [10, 10,  20,  30,  30,  20, 10, 10],
+              [ 5,  5,  10,  25,  25,  10,  5,  5],
+              [ 0,  0,   0,  20,  20,   0,  0,  0],
+              [ 5, -5, -10,   0,   0, -10, -5,  5],
+              [ 5, 10,  10, -20, -20,  10, 10,  5],
+              [ 0,  0,   0,   0,   0,   0,  0,  0]]
+
+piecePositionScores = {"N": knightScores, "B": bishopScores, "R": rookScores,
+                       "Q": queenScores, "K": kingScores, "P": pawnScores}
+
+# per piece (with color) lookups used for the running totals, black's tables are mirrored and negated
+pieceValues = {}
+piecePositionValues = {}
+for piece in 'PRNBQK':
+    pieceValues['w' + piece] = pieceScore[piece]
+    pieceValues['b' + piece] = -pieceScore[piece]
+    piecePositionValues['w' + piece] = [piecePositionScores[piece][sq // 8][sq % 8] for sq in range(64)]
+    piecePositionValues['b' + piece] = [-piecePositionScores[piece][7 - sq // 8][sq % 8] for sq in range(64)]
+
+# castling rights left after a move from or to each square: moving the king or a rook, or capturing a rook
+# on its home square, clears them (bits as in castleRights.getMask)
+castleMaskKeep = [15] * 64
+castleMaskKeep[60] = 15 ^ 3 # e1, both white rights
+castleMaskKeep[63] = 15 ^ 1 # h1
+castleMaskKeep[56] = 15 ^ 2 # a1
+castleMaskKeep[4] = 15 ^ 12 # e8, both black rights
+castleMaskKeep[7] = 15 ^ 4 # h8
+castleMaskKeep[0] = 15 ^ 8 # a8
+
+# makeMove pushes the state it can't work out backwards onto gameState.stateStack, stateSize ints per move:
+# castle mask, en passant square (-1 for none), zobrist hash, halfmove clock and the two cached attack maps
+stateSize = 6
+
+# FEN piece letters (white upper case)
+fenPieces = {piece: 'w' + piece for piece in 'PRNBQK'}
+fenPieces.update({piece.lower(): 'b' + piece for piece in 'PRNBQK'})
+
+debugIncrementalState = False # makeMove and undo check every running total against a full recompute
+
 class gameState():
-    def __init__(self):
+    # useBitboards selects the bitboard move generator, otherwise moves come from walking the board list
+    # useAttackMaps caches the squares each side attacks, so check tests become a single lookup
+    def __init__(self, useBitboards=True, useAttackMaps=False):
         # the board is an 8 by 8 two dimensional list
         # "--" means blank space with no piece on it
         # this is what the starting gameboard will look like
@@ -17,31 +125,273 @@ class gameState():
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
         ]
         self.whiteTurn = True
+        self.enpassantPossible = () # coordinates for square where enpassant capture is possible
+        self.castleMask = 15 # castling rights (see castleRights.getMask), currentCastlingRight reads them as an object
+        self.halfmoveClock = 0 # moves since the last capture or pawn move
+        self.fullmoveNumber = 1 # goes up after every black move
+        self.useBitboards = useBitboards
+        self.useAttackMaps = useAttackMaps
+        self.initState()
+
+    # sets up everything that follows from the board, side to move, castling rights and en passant square:
+    # king locations, an empty move log and undo stack, bitboards, attack maps, hash and evaluation
+    def initState(self):
         self.moveLog = []
-        self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4)
         self.checkMate = False
         self.staleMate = False
-        self.enpassantPossible = () # coordinates for square where enpassant capture is possible
-        self.currentCastlingRight = castleRights(True, True, True, True)
-        self.castleRightsLog = [castleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                            self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        self.sideInCheck = False # whether the side to move was in check when getValidMoves last ran
+        self.stateStack = [0] * (stateSize * 256) # undo information, grows if a game gets longer
+        self.stateTop = 0
+        self.underPromotions = False # also generate promotions to rook, bishop and knight (the board only promotes to a queen)
+        self.initBitboards()
+        self.whiteKingLocation = chessBitboards.squareCoords[self.bitboards['wK'].bit_length() - 1]
+        self.blackKingLocation = chessBitboards.squareCoords[self.bitboards['bK'].bit_length() - 1]
+        self.attackMaps = {'w': None, 'b': None} # filled in when first needed
+        self.zobristHash = self.computeHash() # updated by makeMove, restored by undo
+        self.computeEvaluation() # materialScore and positionScore, updated by makeMove and undo
+
+    # game state for the position in a FEN string
+    # the fields are set directly (nothing is replayed), the move counters can be left off
+    @classmethod
+    def fromFEN(cls, fen, useBitboards=True, useAttackMaps=False):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        placement, turn, castling, enpassant = fields[:4]
+        rows = placement.split('/')
+        if len(rows) != 8:
+            raise ValueError("FEN board needs 8 rows: " + fen)
+        board = []
+        for r in range(8):
+            row = []
+            for char in rows[r]:
+                if char in fenPieces:
+                    row.append(fenPieces[char])
+                elif char in '12345678':
+                    row += ["--"] * int(char)
+                else:
+                    raise ValueError("bad piece '" + char + "' in FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("FEN row " + str(r+1) + " doesn't have 8 squares: " + fen)
+            board.append(row)
+        if placement.count('K') != 1 or placement.count('k') != 1:
+            raise ValueError("FEN needs one king of each color: " + fen)
+        if turn not in ('w', 'b'):
+            raise ValueError("FEN side to move must be w or b: " + fen)
+        if castling != '-' and (not castling or set(castling) - set('KQkq')):
+            raise ValueError("bad castling rights in FEN: " + fen)
+        if enpassant != '-' and (len(enpassant) != 2 or enpassant[0] not in Move.filesToCols or enpassant[1] not in '36'):
+            raise ValueError("bad en passant square in FEN: " + fen)
+        # make and undo move the pieces these name without looking, so they have to be where they say
+        for right, king, rook, row, col in (('K', 'wK', 'wR', 7, 7), ('Q', 'wK', 'wR', 7, 0), ('k', 'bK', 'bR', 0, 7), ('q', 'bK', 'bR', 0, 0)):
+            if right in castling and (board[row][4] != king or board[row][col] != rook):
+                raise ValueError("castling right " + right + " without the king and rook on their squares in FEN: " + fen)
+        if enpassant != '-':
+            row, col = Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]]
+            pawnRow = row + 1 if turn == 'w' else row - 1 # where the pawn that just moved two squares stands
+            if enpassant[1] != ('6' if turn == 'w' else '3') or board[pawnRow][col] != ('bP' if turn == 'w' else 'wP') or board[row][col] != '--':
+                raise ValueError("en passant square doesn't follow a two square pawn move in FEN: " + fen)
+
+        gs = cls.__new__(cls) # skips setting up the starting position first
+        gs.board = board
+        gs.whiteTurn = turn == 'w'
+        gs.enpassantPossible = (Move.ranksToRows[enpassant[1]], Move.filesToCols[enpassant[0]]) if enpassant != '-' else ()
+        gs.castleMask = sum(1 << i for i in range(4) if 'KQkq'[i] in castling)
+        gs.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        gs.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+        gs.useBitboards = useBitboards
+        gs.useAttackMaps = useAttackMaps
+        gs.initState()
+        return gs
+
+    # FEN string of the current position
+    def toFEN(self):
+        rows = []
+        for row in self.board:
+            text = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    text += str(empty)
+                    empty = 0
+                text += piece[1] if piece[0] == 'w' else piece[1].lower()
+            if empty:
+                text += str(empty)
+            rows.append(text)
+        castling = ''.join('KQkq'[i] for i in range(4) if self.castleMask & (1 << i)) or '-'
+        if self.enpassantPossible != ():
+            enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+        else:
+            enpassant = '-'
+        return "%s %s %s %s %d %d" % ('/'.join(rows), 'w' if self.whiteTurn else 'b', castling, enpassant,
+                                      self.halfmoveClock, self.fullmoveNumber)
+
+    # the castling rights as a castleRights object (a copy, set it to change them)
+    @property
+    def currentCastlingRight(self):
+        return castleRights.fromMask(self.castleMask)
+
+    @currentCastlingRight.setter
+    def currentCastlingRight(self, rights):
+        self.castleMask = rights.getMask()
+
+    # builds one bitboard per piece type and color from the board list
+    # the bitboards are kept up to date by makeMove and undo whichever move generator is selected
+    def initBitboards(self):
+        self.bitboards = {color + piece: 0 for color in 'wb' for piece in 'PRNBQK'}
+        self.colorBitboards = {'w': 0, 'b': 0}
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    self.bitboards[piece] |= chessBitboards.squareBits[r*8 + c]
+                    self.colorBitboards[piece[0]] |= chessBitboards.squareBits[r*8 + c]
+
+    # totals the evaluation terms from scratch: material in pawns and piece square scores in hundredths of a pawn
+    def computeEvaluation(self):
+        self.materialScore = 0
+        self.positionScore = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    self.materialScore += pieceValues[piece]
+                    self.positionScore += piecePositionValues[piece][r*8 + c]
+
+    # static evaluation in pawns, positive is good for white
+    def getEvaluation(self):
+        return self.materialScore + self.positionScore / 100
+
+    # the board as a NumPy array (numpy is optional, see chessNumpy): int8 8x8 piece codes,
+    # or with planes=True 12x64 uint8 planes, one per piece type and color
+    def toArray(self, planes=False):
+        import chessNumpy
+        return chessNumpy.toPlanes(self) if planes else chessNumpy.toBoardArray(self)
+
+    # adds (sign 1) or takes back (sign -1) the evaluation changes made by move
+    def updateEvaluation(self, move, sign):
+        startSq = move.startRow*8 + move.startCol
+        endSq = move.endRow*8 + move.endCol
+        positions = piecePositionValues
+        if move.isPawnPromotion:
+            promoted = move.pieceMoved[0] + move.promotionChoice
+            position = positions[promoted][endSq] - positions[move.pieceMoved][startSq]
+            material = pieceValues[promoted] - pieceValues[move.pieceMoved]
+        else:
+            position = positions[move.pieceMoved][endSq] - positions[move.pieceMoved][startSq]
+            material = 0
+        if move.pieceCaptured != '--':
+            captureSq = move.startRow*8 + move.endCol if move.isEnpassantMove else endSq
+            position -= positions[move.pieceCaptured][captureSq]
+            material -= pieceValues[move.pieceCaptured]
+        if move.isCastleMove:
+            rook = positions[move.pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2: # king side
+                position += rook[endSq-1] - rook[endSq+1]
+            else: # queen side
+                position += rook[endSq+1] - rook[endSq-2]
+        self.positionScore += sign * position
+        self.materialScore += sign * material
+
+    # compares every incrementally kept value with a recompute from the board (debugging aid)
+    def checkIncrementalState(self):
+        bitboards = self.bitboards
+        materialScore = self.materialScore
+        positionScore = self.positionScore
+        self.initBitboards()
+        self.computeEvaluation()
+        assert bitboards == self.bitboards, "bitboards out of sync with the board"
+        assert materialScore == self.materialScore and positionScore == self.positionScore, "evaluation out of sync"
+        assert self.zobristHash == self.computeHash(), "zobrist hash out of sync"
+
+    # builds the zobrist hash of the position from scratch (makeMove keeps self.zobristHash up to date,
+    # this is for setting up positions and checking the incremental updates)
+    def computeHash(self):
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                if self.board[r][c] != '--':
+                    h ^= zobristPieces[self.board[r][c]][r*8 + c]
+        if not self.whiteTurn:
+            h ^= zobristBlackToMove
+        h ^= zobristCastling[self.castleMask]
+        if self.enpassantPossible != ():
+            h ^= zobristEnpassant[self.enpassantPossible[1]]
+        return h
+
+    # flips the bits changed by a move, calling it a second time with the same move reverts it
+    def toggleBitboards(self, move):
+        bits = chessBitboards.squareBits
+        color = move.pieceMoved[0]
+        startBit = bits[move.startRow*8 + move.startCol]
+        endBit = bits[move.endRow*8 + move.endCol]
+        if move.isPawnPromotion:
+            self.bitboards[move.pieceMoved] ^= startBit
+            self.bitboards[color + move.promotionChoice] ^= endBit
+        else:
+            self.bitboards[move.pieceMoved] ^= startBit | endBit
+        self.colorBitboards[color] ^= startBit | endBit
+
+        if move.pieceCaptured != '--':
+            if move.isEnpassantMove:
+                captureBit = bits[move.startRow*8 + move.endCol]
+            else:
+                captureBit = endBit
+            self.bitboards[move.pieceCaptured] ^= captureBit
+            self.colorBitboards[move.pieceCaptured[0]] ^= captureBit
+
+        if move.isCastleMove:
+            if move.endCol - move.startCol == 2: # king side
+                rookBits = bits[move.endRow*8 + move.endCol+1] | bits[move.endRow*8 + move.endCol-1]
+            else: # queen side
+                rookBits = bits[move.endRow*8 + move.endCol-2] | bits[move.endRow*8 + move.endCol+1]
+            self.bitboards[color + 'R'] ^= rookBits
+            self.colorBitboards[color] ^= rookBits
 
     def makeMove(self, move):
+        # save what undo can't recompute, no objects are created for it
+        stack = self.stateStack
+        top = self.stateTop
+        if top == len(stack):
+            stack.extend([0] * len(stack))
+        oldCastleMask = self.castleMask
+        oldEnpassant = self.enpassantPossible
+        attackMaps = self.attackMaps
+        stack[top] = oldCastleMask
+        stack[top+1] = oldEnpassant[0]*8 + oldEnpassant[1] if oldEnpassant != () else -1
+        stack[top+2] = self.zobristHash
+        stack[top+3] = self.halfmoveClock
+        stack[top+4] = attackMaps['w']
+        stack[top+5] = attackMaps['b']
+        self.stateTop = top + stateSize
+
+        self.toggleBitboards(move)
+        if self.useAttackMaps: # the new maps are built when asked for
+            attackMaps['w'] = None
+            attackMaps['b'] = None
+        if move.pieceMoved[1] == 'P' or move.pieceCaptured != '--':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
         self.board[move.startRow][move.startCol] = "--"
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move) # log move so we can undo later
         self.whiteTurn = not self.whiteTurn # switch player turns
+        if self.whiteTurn: # black just moved
+            self.fullmoveNumber += 1
         
-        # update king location if moved
+        # update king location if moved (the shared squareCoords tuples, nothing is allocated)
         if move.pieceMoved == 'wK':
-            self.whiteKingLocation = (move.endRow, move.endCol)
+            self.whiteKingLocation = chessBitboards.squareCoords[move.endRow*8 + move.endCol]
         elif move.pieceMoved == 'bK':
-            self.blackKingLocation = (move.endRow, move.endCol)
+            self.blackKingLocation = chessBitboards.squareCoords[move.endRow*8 + move.endCol]
         
         # pawn promotion
         if move.isPawnPromotion:
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
 
         # en passant move
         if move.isEnpassantMove:
@@ -49,7 +399,7 @@ class gameState():
         
         # update enpassantPossible variable
         if (move.pieceMoved[1] == 'P') and (abs(move.startRow - move.endRow) == 2): # only on 2 square pawn advances
-            self.enpassantPossible = ((move.startRow + move.endRow)//2, move.startCol)
+            self.enpassantPossible = chessBitboards.squareCoords[(move.startRow + move.endRow)//2*8 + move.startCol]
         else:
             self.enpassantPossible = ()
         
@@ -64,36 +414,110 @@ class gameState():
 
         # updating castling rights (whenever rook or king moves)
         self.updateCastleRights(move)
-        self.castleRightsLog.append(castleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, 
-                                                self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        self.updateHash(move, oldCastleMask, oldEnpassant)
+        self.updateEvaluation(move, 1)
+        if debugIncrementalState:
+            self.checkIncrementalState()
+
+    # xors the changes made by move into the zobrist hash
+    def updateHash(self, move, oldCastleMask, oldEnpassant):
+        startSq = move.startRow*8 + move.startCol
+        endSq = move.endRow*8 + move.endCol
+        h = self.zobristHash ^ zobristBlackToMove ^ zobristPieces[move.pieceMoved][startSq]
+        if move.isPawnPromotion:
+            h ^= zobristPieces[move.pieceMoved[0] + move.promotionChoice][endSq]
+        else:
+            h ^= zobristPieces[move.pieceMoved][endSq]
+        if move.pieceCaptured != '--':
+            if move.isEnpassantMove:
+                h ^= zobristPieces[move.pieceCaptured][move.startRow*8 + move.endCol]
+            else:
+                h ^= zobristPieces[move.pieceCaptured][endSq]
+        if move.isCastleMove:
+            rook = zobristPieces[move.pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2: # king side
+                h ^= rook[endSq+1] ^ rook[endSq-1]
+            else: # queen side
+                h ^= rook[endSq-2] ^ rook[endSq+1]
+        newCastleMask = self.castleMask
+        if newCastleMask != oldCastleMask:
+            h ^= zobristCastling[oldCastleMask] ^ zobristCastling[newCastleMask]
+        if oldEnpassant != ():
+            h ^= zobristEnpassant[oldEnpassant[1]]
+        if self.enpassantPossible != ():
+            h ^= zobristEnpassant[self.enpassantPossible[1]]
+        self.zobristHash = h
+
+    # passes the turn without moving, for null move pruning in the search
+    # None goes on the move log in its place, so undo (or undoNullMove) takes it back like a move
+    def makeNullMove(self):
+        stack = self.stateStack
+        top = self.stateTop
+        if top == len(stack):
+            stack.extend([0] * len(stack))
+        oldEnpassant = self.enpassantPossible
+        stack[top] = self.castleMask
+        stack[top+1] = oldEnpassant[0]*8 + oldEnpassant[1] if oldEnpassant != () else -1
+        stack[top+2] = self.zobristHash
+        stack[top+3] = self.halfmoveClock
+        stack[top+4] = self.attackMaps['w']
+        stack[top+5] = self.attackMaps['b']
+        self.stateTop = top + stateSize
+        self.moveLog.append(None)
+        self.whiteTurn = not self.whiteTurn
+        self.halfmoveClock += 1
+        self.zobristHash ^= zobristBlackToMove
+        if oldEnpassant != ():
+            self.zobristHash ^= zobristEnpassant[oldEnpassant[1]]
+            self.enpassantPossible = ()
+
+    def undoNullMove(self):
+        self.moveLog.pop()
+        self.whiteTurn = not self.whiteTurn
+        stack = self.stateStack
+        top = self.stateTop - stateSize
+        self.stateTop = top
+        self.enpassantPossible = chessBitboards.squareCoords[stack[top+1]] if stack[top+1] >= 0 else ()
+        self.zobristHash = stack[top+2]
+        self.halfmoveClock = stack[top+3]
+        self.checkMate = False
+        self.staleMate = False
 
     # undoes the last move (recorded in the movelog)
     def undo(self):
         if len(self.moveLog) != 0:
+            if self.moveLog[-1] is None:
+                self.undoNullMove()
+                return
             move = self.moveLog.pop()
+            self.toggleBitboards(move)
             self.board[move.startRow][move.startCol] = move.pieceMoved
             self.board[move.endRow][move.endCol] = move.pieceCaptured
             self.whiteTurn = not self.whiteTurn
+            if not self.whiteTurn: # taking back a black move
+                self.fullmoveNumber -= 1
             # update king location if moved
             if move.pieceMoved == 'wK':
-                self.whiteKingLocation = (move.startRow, move.startCol)
+                self.whiteKingLocation = chessBitboards.squareCoords[move.startRow*8 + move.startCol]
             elif move.pieceMoved == 'bK':
-                self.blackKingLocation = (move.startRow, move.startCol)
+                self.blackKingLocation = chessBitboards.squareCoords[move.startRow*8 + move.startCol]
             
             # undo en passant
             if move.isEnpassantMove:
                 self.board[move.endRow][move.endCol] = '--' # leave landing square blank
                 self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            
-            # undo a 2 square pawn advance
-            if (move.pieceMoved[1] == 'P') and (abs(move.startRow - move.endRow) == 2):
-                self.enpassantPossible = ()
             
-            # undo castling rights
-            self.castleRightsLog.pop() # get rid of new castle rights from move we are undoing
-            newRights = self.castleRightsLog[-1] # set current castle rights to last one in the list
-            self.currentCastlingRight = castleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs)
+            # restore castling rights, the en passant square and the rest of the saved state
+            stack = self.stateStack
+            top = self.stateTop - stateSize
+            self.stateTop = top
+            self.castleMask = stack[top]
+            self.enpassantPossible = chessBitboards.squareCoords[stack[top+1]] if stack[top+1] >= 0 else ()
+            self.zobristHash = stack[top+2]
+            self.halfmoveClock = stack[top+3]
+            self.attackMaps['w'] = stack[top+4]
+            self.attackMaps['b'] = stack[top+5]
+            self.updateEvaluation(move, -1)
 
             # undo castle move
             if move.isCastleMove:
@@ -106,33 +530,141 @@ class gameState():
             
             self.checkMate = False
             self.staleMate = False
+            if debugIncrementalState:
+                self.checkIncrementalState()
     
+    # clears the rights of a king or rook that moves, and of a rook captured on its starting square
     def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == 'bK':
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == 'wR':
-            if move.startRow == 7:
-                if move.startCol == 0: # left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7: # right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == 'bR':
-            if move.startRow == 0:
-                if move.startCol == 0: # left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7: # right rook
-                    self.currentCastlingRight.bks = False
-
-    # all moves that are checks
+        self.castleMask &= castleMaskKeep[move.startRow*8 + move.startCol] & castleMaskKeep[move.endRow*8 + move.endCol]
+
+    # all legal moves
+    # checks and pins on the king are found once, so only king moves, en passant captures and
+    # castling need any further testing
     def getValidMoves(self):
-        tempEnpassantPossible = self.enpassantPossible
-        # copy current castling rights
-        tempCastleRights = castleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                        self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
+        moves, inCheck = self.getLegalMoves(False)
+        self.sideInCheck = inCheck
+
+        # check to see if either checkmate or stalemate
+        if len(moves) == 0:
+            if inCheck:
+                self.checkMate = True
+            else:
+                self.staleMate = True
+        else:
+            self.checkMate = False
+            self.staleMate = False
+        return moves
+
+    # legal captures (en passant included) and promotions, used by the quiescence search
+    # unlike getValidMoves it leaves checkMate and staleMate alone
+    def getCaptureMoves(self):
+        return self.getLegalMoves(True)[0]
+
+    # returns the legal moves and whether the side to move is in check
+    def getLegalMoves(self, capturesOnly):
+        if self.whiteTurn:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        checks, pins = self.checkForPinsAndChecks(kingRow, kingCol)
+
+        if len(checks) > 1: # double check, king has to move
+            candidates = []
+            self.getKingMoves(kingRow, kingCol, candidates)
+            if capturesOnly:
+                candidates = [move for move in candidates if move.pieceCaptured != '--']
+        else:
+            candidates = self.getAllPossibleMoves(capturesOnly)
+        if len(checks) == 1: # single check, capture the checking piece or block it
+            checkRow, checkCol, dr, dc = checks[0]
+            blockSquares = [(checkRow, checkCol)]
+            if self.board[checkRow][checkCol][1] != 'N':
+                i = 1
+                while (kingRow + dr*i, kingCol + dc*i) != (checkRow, checkCol):
+                    blockSquares.append((kingRow + dr*i, kingCol + dc*i))
+                    i += 1
+
+        moves = []
+        for move in candidates:
+            if move.pieceMoved[1] == 'K':
+                if not self.squareUnderAttack(move.endRow, move.endCol): # king can't move into check
+                    moves.append(move)
+            elif move.isEnpassantMove: # both pawns leave their squares, so test the resulting position
+                self.makeMove(move)
+                self.whiteTurn = not self.whiteTurn
+                if not self.inCheck():
+                    moves.append(move)
+                self.whiteTurn = not self.whiteTurn
+                self.undo()
+            else:
+                if (move.startRow, move.startCol) in pins: # pinned pieces can only move along the pin
+                    dr, dc = pins[(move.startRow, move.startCol)]
+                    moveRow = move.endRow - kingRow
+                    moveCol = move.endCol - kingCol
+                    if moveRow*dc != moveCol*dr or moveRow*dr + moveCol*dc <= 0:
+                        continue
+                if len(checks) == 1 and (move.endRow, move.endCol) not in blockSquares:
+                    continue
+                moves.append(move)
+
+        if len(checks) == 0 and not capturesOnly:
+            castleMoves = []
+            self.getCastleMoves(kingRow, kingCol, castleMoves)
+            for move in castleMoves:
+                if not self.squareUnderAttack(move.endRow, move.endCol):
+                    moves.append(move)
+        return moves, len(checks) != 0
+
+    # returns the checks on a king standing on r, c and the pieces pinned to it
+    # checks are (row, col, dr, dc) of each checking piece with the direction from the king,
+    # pins map the (row, col) of each pinned piece to the direction of the pin
+    # the moving side's own king is looked through, so this also tests squares the king wants to move to
+    def checkForPinsAndChecks(self, r, c):
+        board = self.board
+        allyColor = 'w' if self.whiteTurn else 'b'
+        enemyColor = 'b' if self.whiteTurn else 'w'
+        # enemy pawns attack the king from the squares diagonally in front of it
+        pawnDirections = ((-1, -1), (-1, 1)) if self.whiteTurn else ((1, -1), (1, 1))
+        checks = []
+        pins = {}
+        sq = r*8 + c
+        for d in range(8):
+            dr, dc = chessBitboards.directions[d]
+            orthogonal = dr == 0 or dc == 0
+            possiblePin = ()
+            distance = 0
+            for target in chessBitboards.raySquares[d][sq]:
+                distance += 1
+                endRow, endCol = chessBitboards.squareCoords[target]
+                endPiece = board[endRow][endCol]
+                if endPiece == '--':
+                    continue
+                if endPiece[0] == allyColor:
+                    if endPiece[1] == 'K':
+                        continue
+                    if possiblePin == (): # first allied piece could be pinned
+                        possiblePin = (endRow, endCol)
+                        continue
+                    break # second allied piece, no pin or check in this direction
+                pieceModel = endPiece[1]
+                if (pieceModel == 'Q' or (orthogonal and pieceModel == 'R') or (not orthogonal and pieceModel == 'B')
+                        or (distance == 1 and pieceModel == 'K')
+                        or (distance == 1 and pieceModel == 'P' and (dr, dc) in pawnDirections)):
+                    if possiblePin == ():
+                        checks.append((endRow, endCol, dr, dc))
+                    else:
+                        pins[possiblePin] = (dr, dc)
+                break
+
+        for target in chessBitboards.knightTargets[sq]:
+            endRow, endCol = chessBitboards.squareCoords[target]
+            if board[endRow][endCol] == enemyColor + 'N':
+                checks.append((endRow, endCol, endRow - r, endCol - c))
+        return checks, pins
+
+    # reference version of getValidMoves: makes every pseudo legal move and throws away the ones
+    # that leave the king in check (slow, kept to cross check the generator above)
+    def getValidMovesBruteForce(self):
         moves = self.getAllPossibleMoves()
         if self.whiteTurn:
             self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
@@ -156,9 +688,6 @@ class gameState():
         else:
             self.checkMate = False
             self.staleMate = False
-
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRight = tempCastleRights
         return moves
     
     # determine if current player in check
@@ -169,17 +698,60 @@ class gameState():
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
     # determine if enemy can attack the square r, c
+    # works outward from the square, so the king of the side to move is treated as transparent
+    # for the sliding pieces (a king stepping back along a check ray stays in check)
     def squareUnderAttack(self, r, c):
-        self.whiteTurn = not self.whiteTurn # switch to opponent turn
-        opponentMoves = self.getAllPossibleMoves()
-        self.whiteTurn = not self.whiteTurn # switch turns back
-        for move in opponentMoves:
-            if move.endRow == r and move.endCol == c: # square is under attack
-                return True
+        enemyColor = 'b' if self.whiteTurn else 'w'
+        if self.useAttackMaps:
+            return self.getAttackMap(enemyColor) & chessBitboards.squareBits[r*8 + c] != 0
+        return self.squareAttackedBy(r*8 + c, enemyColor)
+
+    # checks knight jumps, pawn diagonals, the king ring and the first blocker on each ray from sq
+    def squareAttackedBy(self, sq, color):
+        bb = chessBitboards
+        bitboards = self.bitboards
+        if bb.knightAttacks[sq] & bitboards[color + 'N']:
+            return True
+        # enemy pawns sit on the squares a pawn of the other color on sq would attack
+        if bb.pawnAttacks[0 if color == 'b' else 1][sq] & bitboards[color + 'P']:
+            return True
+        if bb.kingAttacks[sq] & bitboards[color + 'K']:
+            return True
+        occupied = (self.colorBitboards['w'] | self.colorBitboards['b']) ^ bitboards[('w' if color == 'b' else 'b') + 'K']
+        queens = bitboards[color + 'Q']
+        if bb.rookAttacks(sq, occupied) & (bitboards[color + 'R'] | queens):
+            return True
+        if bb.bishopAttacks(sq, occupied) & (bitboards[color + 'B'] | queens):
+            return True
         return False
 
+    # every square attacked by color, with the other king left out of the blockers the same way
+    # squareUnderAttack does it (cached until the next makeMove, and restored by undo)
+    def getAttackMap(self, color):
+        attacks = self.attackMaps[color]
+        if attacks is None:
+            bb = chessBitboards
+            bitboards = self.bitboards
+            occupied = (self.colorBitboards['w'] | self.colorBitboards['b']) ^ bitboards[('w' if color == 'b' else 'b') + 'K']
+            attacks = bb.pawnAttackMap(bitboards[color + 'P'], color == 'w')
+            for sq in bb.bitSquares(bitboards[color + 'N']):
+                attacks |= bb.knightAttacks[sq]
+            for sq in bb.bitSquares(bitboards[color + 'K']):
+                attacks |= bb.kingAttacks[sq]
+            for sq in bb.bitSquares(bitboards[color + 'R'] | bitboards[color + 'Q']):
+                attacks |= bb.rookAttacks(sq, occupied)
+            for sq in bb.bitSquares(bitboards[color + 'B'] | bitboards[color + 'Q']):
+                attacks |= bb.bishopAttacks(sq, occupied)
+            self.attackMaps[color] = attacks
+        return attacks
+
     # all moves without considering checks
-    def getAllPossibleMoves(self):
+    # capturesOnly leaves out everything but captures and promotions
+    def getAllPossibleMoves(self, capturesOnly=False):
+        if self.useBitboards:
+            return self.getBitboardMoves(capturesOnly)
+        if capturesOnly:
+            return [move for move in self.getAllPossibleMoves() if move.pieceCaptured != '--' or move.isPawnPromotion]
         moves = []
         for r in range(len(self.board)): # number of rows
             for c in range(len(self.board[r])): # number of cols in a row
@@ -188,7 +760,10 @@ class gameState():
                     pieceModel = self.board[r][c][1]
 
                     if pieceModel == 'P': # if the piece model is pawn
+                        first = len(moves)
                         self.getPawnMoves(r,c,moves)
+                        if self.underPromotions:
+                            self.addUnderPromotions(moves, first)
 
                     elif pieceModel == 'R': # if piece model is rook
                         self.getRookMoves(r,c,moves)
@@ -206,6 +781,87 @@ class gameState():
                         self.getKingMoves(r,c,moves)
         return moves
 
+    # same moves (in the same order) as the board walking generators below, read off the bitboards
+    # the moves are built with newMove, the board is only read for the moving and captured pieces
+    def getBitboardMoves(self, capturesOnly=False):
+        bb = chessBitboards
+        bits = bb.squareBits
+        coords = bb.squareCoords
+        board = self.board
+        moves = []
+        if self.whiteTurn:
+            own = self.colorBitboards['w']
+            enemy = self.colorBitboards['b']
+            pawnStep = -8
+            pawnStartRow = 6
+            pawnPromotionRow = 1 # row the pawns promote from
+            pawnCaptures = bb.pawnCaptureTargets[0]
+        else:
+            own = self.colorBitboards['b']
+            enemy = self.colorBitboards['w']
+            pawnStep = 8
+            pawnStartRow = 1
+            pawnPromotionRow = 6
+            pawnCaptures = bb.pawnCaptureTargets[1]
+        occupied = own | enemy
+        targetsMask = enemy if capturesOnly else bb.FULL ^ own
+        enpassantSquare = self.enpassantPossible[0]*8 + self.enpassantPossible[1] if self.enpassantPossible != () else -1
+
+        pieces = own
+        while pieces:
+            low = pieces & -pieces
+            pieces ^= low
+            sq = low.bit_length() - 1
+            startRow = sq >> 3
+            piece = board[startRow][sq & 7]
+            pieceModel = piece[1]
+
+            if pieceModel == 'P':
+                first = len(moves)
+                promotion = startRow == pawnPromotionRow
+                ahead = sq + pawnStep
+                if not occupied & bits[ahead] and (not capturesOnly or promotion): # one square advance
+                    moves.append(newMove(sq, ahead, piece, '--', promotion))
+                    if startRow == pawnStartRow and not capturesOnly and not occupied & bits[ahead + pawnStep]: # two square advance
+                        moves.append(newMove(sq, ahead + pawnStep, piece, '--'))
+                for target in pawnCaptures[sq]: # captures to the left then to the right
+                    if enemy & bits[target]:
+                        moves.append(newMove(sq, target, piece, board[target >> 3][target & 7], promotion))
+                    elif target == enpassantSquare:
+                        moves.append(Move(coords[sq], coords[target], board, isEnpassantMove=True))
+                if promotion and self.underPromotions:
+                    self.addUnderPromotions(moves, first)
+                continue
+
+            if pieceModel == 'N':
+                attacks = bb.knightAttacks[sq] & targetsMask
+                order = bb.knightTargets[sq]
+            elif pieceModel == 'K':
+                attacks = bb.kingAttacks[sq] & targetsMask
+                order = bb.kingTargets[sq]
+            elif pieceModel == 'R':
+                attacks = bb.rookAttacks(sq, occupied) & targetsMask
+                order = bb.rookTargets[sq]
+            elif pieceModel == 'B':
+                attacks = bb.bishopAttacks(sq, occupied) & targetsMask
+                order = bb.bishopTargets[sq]
+            else:
+                attacks = bb.queenAttacks(sq, occupied) & targetsMask
+                order = bb.queenTargets[sq]
+            for target in order:
+                bit = bits[target]
+                if attacks & bit:
+                    moves.append(newMove(sq, target, piece, board[target >> 3][target & 7] if enemy & bit else '--'))
+        return moves
+
+    # adds rook, bishop and knight versions of the promotions in moves[first:]
+    def addUnderPromotions(self, moves, first):
+        for i in range(first, len(moves)):
+            move = moves[i]
+            if move.isPawnPromotion:
+                for choice in 'RBN':
+                    moves.append(Move((move.startRow, move.startCol), (move.endRow, move.endCol), self.board, promotionChoice=choice))
+
     # for all "get" moves, gets all moves for the piece located at row, col and adds these moves to a list
     def getPawnMoves(self, r, c, moves):
         # for white pawn
@@ -872,9 +1528,9 @@ class gameState():
     def getCastleMoves(self, r, c, moves):
         if self.squareUnderAttack(r,c):
             return # cant't castle while in check
-        if (self.whiteTurn and self.currentCastlingRight.wks) or (not self.whiteTurn and self.currentCastlingRight.bks):
+        if self.castleMask & (1 if self.whiteTurn else 4): # king side right
             self.getKingsideCastleMoves(r,c,moves)
-        if (self.whiteTurn and self.currentCastlingRight.wqs) or (not self.whiteTurn and self.currentCastlingRight.bqs):
+        if self.castleMask & (2 if self.whiteTurn else 8): # queen side right
             self.getQueensideCastleMoves(r,c,moves)
 
     def getKingsideCastleMoves(self,r,c,moves):
@@ -894,7 +1550,18 @@ class castleRights():
         self.wqs = wqs
         self.bqs = bqs
 
+    # rights packed into 4 bits (wks, wqs, bks, bqs), used to index the zobrist castling keys
+    def getMask(self):
+        return self.wks | self.wqs << 1 | self.bks << 2 | self.bqs << 3
+
+    @classmethod
+    def fromMask(cls, mask):
+        return cls(mask & 1 != 0, mask & 4 != 0, mask & 2 != 0, mask & 8 != 0)
+
 class Move():
+    # fixed attributes instead of a per move __dict__ (smaller and quicker to build)
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'isPawnPromotion',
+                 'promotionChoice', 'isEnpassantMove', 'isCastleMove', 'moveID')
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4,
                    "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
@@ -902,17 +1569,19 @@ class Move():
                    "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
     
-    def __init__(self, startsq, endsq, board, isEnpassantMove=False, isCastleMove = False):
+    promotionCodes = {"Q": 0, "R": 1, "B": 2, "N": 3}
+
+    def __init__(self, startsq, endsq, board, isEnpassantMove=False, isCastleMove = False, promotionChoice='Q'):
         self.startRow = startsq[0]
         self.startCol = startsq[1]
         self.endRow = endsq[0]
         self.endCol = endsq[1]
         self.pieceMoved = board[self.startRow][self.startCol]
         self.pieceCaptured = board[self.endRow][self.endCol]
-        self.isPawnPromotion = False
 
         # pawn promotion
         self.isPawnPromotion = (self.pieceMoved == 'wP' and self.endRow == 0) or (self.pieceMoved == 'bP' and self.endRow == 7)
+        self.promotionChoice = promotionChoice # piece the pawn becomes, only used when isPawnPromotion
         
         # en passant
         self.isEnpassantMove = isEnpassantMove
@@ -923,6 +1592,8 @@ class Move():
         self.isCastleMove = isCastleMove
 
         self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        if self.isPawnPromotion:
+            self.moveID += self.promotionCodes[promotionChoice] * 10000 # queen promotions keep the plain id
 
     # overriding the equals method
     def __eq__(self, other):
@@ -931,7 +1602,28 @@ class Move():
         return False
     
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.isPawnPromotion:
+            notation += self.promotionChoice.lower()
+        return notation
 
     def getRankFile(self, r, c):
-        return self.colsToFiles[c] + self.rowsToRanks[r]
\ No newline at end of file
+        return self.colsToFiles[c] + self.rowsToRanks[r]
+
+# (startRow, startCol, endRow, endCol, moveID) for every start and end square index
+moveGeometry = [[(start // 8, start % 8, end // 8, end % 8, (start // 8) * 1000 + (start % 8) * 100 + (end // 8) * 10 + end % 8)
+                 for end in range(64)] for start in range(64)]
+newObject = object.__new__
+
+# builds an ordinary move (no en passant, castling or under promotion) from square indexes and the pieces
+# involved, skipping the board reads and arithmetic in Move.__init__ (used by the bitboard generator)
+def newMove(startSq, endSq, pieceMoved, pieceCaptured, isPawnPromotion=False):
+    move = newObject(Move)
+    move.startRow, move.startCol, move.endRow, move.endCol, move.moveID = moveGeometry[startSq][endSq]
+    move.pieceMoved = pieceMoved
+    move.pieceCaptured = pieceCaptured
+    move.isPawnPromotion = isPawnPromotion
+    move.promotionChoice = 'Q'
+    move.isEnpassantMove = False
+    move.isCastleMove = False
+    return move
@@ -34,6 +34,9 @@ def main():
     gameOver = False
     playerOne = True # if human playing white, this is true, if ai playing then false
     playerTwo = False # same as above but for black
+    AISearch = None # background search for the AI's move, the window keeps drawing while it runs
+    AIResult = None # finished search whose move the AI plays next
+    ponder = None # background search of the reply the AI expects, run while the human thinks
 
     while running:
         humanTurn = (gs.whiteTurn and playerOne) or (not gs.whiteTurn and playerTwo)
@@ -61,6 +64,9 @@ def main():
                         for i in range(len(validMoves)):
                             if move == validMoves[i]:
                                 gs.makeMove(validMoves[i])
+                                if ponder is not None:
+                                    AIResult = finishPonder(ponder, validMoves[i])
+                                    ponder = None
                                 moveMade = True
                                 animate = True
                                 sqSelected = () # reset user clicks
@@ -71,11 +77,13 @@ def main():
             # key handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_u: # undo when 'u' is pressed
+                    AISearch, AIResult, ponder = cancelSearches(AISearch, ponder)
                     gs.undo()
                     moveMade = True
                     animate = False
                     gameOver = False
                 if e.key == p.K_r: # reset board when 'r' is pressed
+                    AISearch, AIResult, ponder = cancelSearches(AISearch, ponder)
                     gs = chessEngine.gameState()
                     validMoves = gs.getValidMoves()
                     sqSelected = ()
@@ -84,14 +92,30 @@ def main():
                     animate = False
                     gameOver = False
         
-        # AI move finder
-        if not gameOver and not humanTurn:
-            AIMove = chessAI.findBestMove(gs, validMoves)
-            if AIMove is None:
-                AIMove = chessAI.findRandomMove(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
-            animate = True
+        # AI move finder, the search runs in the background and the move is played once it is done
+        # (straight away if pondering already searched the position deep enough)
+        if not gameOver and not humanTurn and not moveMade:
+            if AIResult is None and AISearch is None:
+                AISearch = chessAI.backgroundSearch(gs)
+            if AISearch is not None and AISearch.isDone():
+                AIResult = AISearch.result
+                AISearch = None
+            if AIResult is not None:
+                AIMove = AIResult.bestMove
+                if AIMove is None:
+                    AIMove = chessAI.findRandomMove(validMoves)
+                gs.makeMove(AIMove)
+                moveMade = True
+                animate = True
+                # ponder on the reply the search expects while the human thinks (a ponder has no budget,
+                # so only when a human is to move and will stop it)
+                if ponder is not None:
+                    ponder.stop()
+                    ponder = None
+                humanNext = (gs.whiteTurn and playerOne) or (not gs.whiteTurn and playerTwo)
+                if humanNext and len(AIResult.pv) > 1:
+                    ponder = chessAI.backgroundSearch(gs, ponderMove=AIResult.pv[1])
+                AIResult = None
 
         if moveMade:
             if animate:
@@ -115,6 +139,22 @@ def main():
         clock.tick(maxFPS)
         p.display.flip()
 
+# stops the ponder search once the human has moved
+# if it searched the move that was played deep enough its result is returned for the AI to play
+def finishPonder(ponder, humanMove):
+    result = ponder.stop()
+    if humanMove == ponder.ponderMove and result is not None and result.depth >= chessAI.DEPTH and result.bestMove is not None:
+        return result
+    return None
+
+# throws away any running AI search (after an undo or a reset), returns the cleared AISearch, AIResult and ponder
+def cancelSearches(AISearch, ponder):
+    if AISearch is not None:
+        AISearch.stop()
+    if ponder is not None:
+        ponder.stop()
+    return None, None, None
+
 # highlight square selected and moves for piece selected
 def highlightSquares(screen, gs, validMoves, sqSelected):
     if sqSelected != ():
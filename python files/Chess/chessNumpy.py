@@ -0,0 +1,172 @@
+# NumPy encodings of positions, and an evaluator that scores a whole batch of them with a few array
+# operations instead of a Python loop per position (for offline analysis, or all the children of a node)
+# numpy is optional: nothing else imports this module except gameState.toArray, and its functions raise
+# ImportError when numpy isn't installed
+# run from the Chess folder:
+#   python chessNumpy.py          checks evaluateBatch against the engine and times both on openings.pgn
+
+import os, sys, time
+import chessEngine, chessBitboards, chessBook
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+GAMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openings.pgn")
+MOBILITY_WEIGHT = 0.02 # pawns per square a knight, bishop, rook or queen attacks (not counting its own side's)
+
+# order of the 12 planes, and the int8 code of each piece in the 8x8 encoding (black negative, empty 0)
+planeNames = [color + piece for color in 'wb' for piece in 'PNBRQK']
+pieceCodes = {'--': 0}
+for i, piece in enumerate('PNBRQK'):
+    pieceCodes['w' + piece] = i + 1
+    pieceCodes['b' + piece] = -(i + 1)
+
+knightSteps = chessBitboards.knightSteps
+bishopSteps = [chessBitboards.directions[d] for d in chessBitboards.bishopDirections]
+rookSteps = [chessBitboards.directions[d] for d in chessBitboards.rookDirections]
+
+tables = None # (plane codes, plane values, position values) arrays, built on first use
+
+def requireNumpy():
+    if np is None:
+        raise ImportError("chessNumpy needs numpy (pip install numpy)")
+
+def getTables():
+    global tables
+    requireNumpy()
+    if tables is None:
+        codes = np.array([pieceCodes[name] for name in planeNames], np.int8)
+        values = np.array([chessEngine.pieceValues[name] for name in planeNames], np.float64)
+        positions = np.array([chessEngine.piecePositionValues[name] for name in planeNames], np.float64) / 100
+        tables = (codes, values, positions)
+    return tables
+
+# the 12 piece bitboards as 8 bytes each, in planeNames order
+# (bytes straight from the bitboards gameState already keeps, no walk over the board)
+def planeBytes(gs):
+    bitboards = gs.bitboards
+    return b"".join(bitboards[name].to_bytes(8, 'little') for name in planeNames)
+
+# (N, 12, 64) uint8 array from the planeBytes of N positions, squares indexed row*8 + col like the bitboards
+def unpackPlanes(buffer):
+    requireNumpy()
+    return np.unpackbits(np.frombuffer(buffer, np.uint8), bitorder='little').reshape(-1, 12, 64)
+
+# (12, 64) planes of one position, 1 where the plane's piece stands
+def toPlanes(gs):
+    return unpackPlanes(planeBytes(gs))[0]
+
+# (8, 8) int8 array of pieceCodes, row 0 is the 8th rank like gameState.board
+def toBoardArray(gs):
+    codes = getTables()[0]
+    return (codes @ toPlanes(gs).astype(np.int8)).reshape(8, 8)
+
+# (N, 12, 64) planes of every game state, unpacked in one call
+def stackPlanes(gameStates):
+    return unpackPlanes(b"".join(planeBytes(gs) for gs in gameStates))
+
+# (N, 12, 64) planes of the position after each move (each made and taken back again)
+def childPlanes(gs, moves):
+    buffers = []
+    for move in moves:
+        gs.makeMove(move)
+        buffers.append(planeBytes(gs))
+        gs.undo()
+    return unpackPlanes(b"".join(buffers))
+
+# boards (N, 8, 8) moved dr rows down and dc columns right, anything shifted off the edge is dropped
+def shift(boards, dr, dc):
+    moved = np.zeros_like(boards)
+    moved[:, max(dr, 0):8 + min(dr, 0), max(dc, 0):8 + min(dc, 0)] = boards[:, max(-dr, 0):8 + min(-dr, 0), max(-dc, 0):8 + min(-dc, 0)]
+    return moved
+
+# a cheap stand in for mobility: squares attacked by each side's knights, bishops, rooks and queens that
+# their own pieces don't stand on (counted once per attacker), white's less black's, for every position
+# pins, checks and the pawns' and kings' moves are left out
+def mobility(planes):
+    requireNumpy()
+    boards = np.asarray(planes).reshape(-1, 12, 8, 8).astype(np.int16)
+    empty = 1 - boards.sum(axis=1)
+    counts = np.zeros(len(boards), np.int64)
+    for sign, first in ((1, 0), (-1, 6)): # white planes, then black ones
+        own = boards[:, first:first + 6].sum(axis=1)
+        attacks = np.zeros_like(empty)
+        for dr, dc in knightSteps:
+            attacks += shift(boards[:, first + 1], dr, dc)
+        queens = boards[:, first + 4]
+        for steps, sliders in ((bishopSteps, boards[:, first + 2] + queens), (rookSteps, boards[:, first + 3] + queens)):
+            for dr, dc in steps:
+                front = sliders
+                for distance in range(7): # walk every ray out together until it hits a piece or the edge
+                    front = shift(front, dr, dc)
+                    attacks += front
+                    front = front * empty
+                    if not front.any():
+                        break
+        counts += sign * (attacks * (1 - own)).sum(axis=(1, 2))
+    return counts
+
+# static evaluations of a batch of positions in pawns, positive is good for white: material and piece square
+# scores (the same terms gameState.getEvaluation keeps, so mobilityWeight=0 gives its numbers) plus
+# mobilityWeight times mobility. planes is (N, 12, 64) from stackPlanes or childPlanes
+# checkmate and stalemate aren't recognised here, they need move generation (see chessAI.scoreBoard)
+def evaluateBatch(planes, mobilityWeight=MOBILITY_WEIGHT):
+    codes, values, positions = getTables()
+    planes = np.asarray(planes)
+    scores = planes.sum(axis=2) @ values + np.einsum('npq,pq->n', planes, positions)
+    if mobilityWeight:
+        scores += mobilityWeight * mobility(planes)
+    return scores
+
+# evaluations of the position after each of the moves, from the point of view of the side to move in gs
+# (the one choosing between them), in the order of moves
+def evaluateChildren(gs, moves=None, mobilityWeight=MOBILITY_WEIGHT):
+    if moves is None:
+        moves = gs.getValidMoves()
+    turnMultiplier = 1 if gs.whiteTurn else -1
+    return turnMultiplier * evaluateBatch(childPlanes(gs, moves), mobilityWeight)
+
+# a game state for every position of every game in the PGN file
+def gamePositions(path=GAMES_PATH):
+    gameStates = []
+    with open(path) as stream:
+        for tags, sanMoves in chessBook.readGames(stream):
+            gs = chessEngine.gameState()
+            for san in sanMoves:
+                gs.makeMove(chessBook.parseSAN(gs, san, gs.getValidMoves()))
+                gameStates.append(chessEngine.gameState.fromFEN(gs.toFEN()))
+    return gameStates
+
+if __name__ == "__main__":
+    if np is None:
+        print("numpy is not installed")
+        sys.exit(1)
+    gameStates = gamePositions()
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    gameStates = gameStates * repeats
+
+    # one position at a time, totalled from the board by the interpreter
+    start = time.perf_counter()
+    for gs in gameStates:
+        gs.computeEvaluation()
+    loopTime = time.perf_counter() - start
+    expected = np.array([gs.getEvaluation() for gs in gameStates])
+
+    start = time.perf_counter()
+    planes = stackPlanes(gameStates)
+    encodeTime = time.perf_counter() - start
+    start = time.perf_counter()
+    scores = evaluateBatch(planes, 0)
+    batchTime = time.perf_counter() - start
+    start = time.perf_counter()
+    evaluateBatch(planes)
+    mobilityTime = time.perf_counter() - start
+
+    print("%d positions" % len(gameStates))
+    print("computeEvaluation loop    %8.1f ms" % (loopTime * 1000))
+    print("stackPlanes               %8.1f ms" % (encodeTime * 1000))
+    print("evaluateBatch             %8.1f ms" % (batchTime * 1000))
+    print("evaluateBatch + mobility  %8.1f ms" % (mobilityTime * 1000))
+    print("scores match getEvaluation" if np.allclose(scores, expected) else "SCORES DIFFER from getEvaluation")
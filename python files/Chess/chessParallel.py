@@ -0,0 +1,213 @@
+# parallel search over several processes (threads can't search at the same time because of the GIL)
+#
+# lazy SMP: every process runs the normal iterative deepening search of chessAI on the same position,
+# and they all use one transposition table in shared memory, so what one process finds cuts the others'
+# searches short. Helpers start one depth deeper every other process and try the root moves in their
+# own order, so they don't all walk the same tree at the same time.
+# the main process' search decides when everyone stops, the deepest finished result is played
+#
+# root splitting (rootSplitSearch) is for fixed depth searches of many positions: the calling process
+# searches one ply short of the depth itself, then the root moves are handed out one at a time to a pool of
+# processes that is kept between calls. The pool uses the shared table too, so the shallower search's
+# best moves order theirs, and the best score found so far is shared through a multiprocessing.Value
+# so moves searched later get a narrower window
+# its result is not deterministic: the window each move gets, and what the pool processes' tables hold,
+# depend on the order the tasks happen to finish, so between moves of about the same score the pick (and
+# the score) can change from run to run and differ from chessAI.search's
+
+import multiprocessing, queue, random, atexit, time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import chessAI, chessTranspositionTable
+
+WORKERS = multiprocessing.cpu_count() # processes searching at once, the calling process included
+sharedMemory = None # shared memory block holding sharedTable, created on first use
+sharedTable = None
+sharedSizeMB = 0 # the chessAI.hashSizeMB the block was made for, helpers have to see the same layout
+rootPool = None # process pool for rootSplitSearch, created on first use and kept while the worker count stays
+rootPoolWorkers = 0
+rootPoolMemory = None # name of the shared memory block the pool's processes have their table on
+rootAlpha = None # best root score so far in the current rootSplitSearch, shared with the pool
+rootTable = None # in a pool process, its view of the shared table
+rootMemory = None # and the shared memory block under it
+
+# the transposition table in shared memory, kept between searches like chessAI's own table
+# (made again, empty, if chessAI.hashSizeMB has changed since)
+def getSharedTable():
+    global sharedMemory, sharedTable, sharedSizeMB
+    if sharedTable is not None and sharedSizeMB != chessAI.hashSizeMB:
+        closeSharedTable()
+    if sharedTable is None:
+        if sharedSizeMB == 0:
+            atexit.register(closeSharedTable)
+        sharedSizeMB = chessAI.hashSizeMB
+        sharedMemory = shared_memory.SharedMemory(create=True, size=chessTranspositionTable.tableBytes(sharedSizeMB))
+        sharedTable = chessTranspositionTable.transpositionTable(sharedSizeMB, sharedMemory.buf)
+    return sharedTable
+
+def closeSharedTable():
+    global sharedMemory, sharedTable
+    if sharedTable is not None:
+        sharedTable.release()
+        sharedMemory.close()
+        sharedMemory.unlink()
+        sharedMemory = None
+        sharedTable = None
+
+# same as chessAI.findBestMove, searching with workers processes
+def findBestMove(gs, validMoves, depth=None, timeLimit=None, nodeLimit=None, workers=None):
+    return search(gs, validMoves, depth, timeLimit, nodeLimit, workers).bestMove
+
+# same as chessAI.search, searching with workers processes (WORKERS if not given)
+# nodeLimit only counts the main search, result.nodes adds up every process
+def search(gs, validMoves, depth=None, timeLimit=None, nodeLimit=None, workers=None):
+    if workers is None:
+        workers = WORKERS
+    if depth is None:
+        depth = chessAI.DEPTH if timeLimit is None and nodeLimit is None else chessAI.MAX_DEPTH
+    tt = getSharedTable()
+    stopEvent = multiprocessing.Event()
+    reports = multiprocessing.Queue()
+    helpers = []
+    if len(validMoves) > 1:
+        for index in range(1, workers):
+            helper = multiprocessing.Process(target=helperSearch, daemon=True,
+                                             args=(index, gs, validMoves, depth, timeLimit, sharedMemory.name,
+                                                   sharedSizeMB, tt.generation, stopEvent, reports))
+            helper.start()
+            helpers.append(helper)
+
+    result = chessAI.searcher(tt).search(gs, validMoves, depth, timeLimit, nodeLimit)
+    stopEvent.set()
+
+    # helpers report (moveID, score, depth, nodes) once they have stopped
+    finished = 0
+    while finished < len(helpers):
+        try:
+            moveID, score, helperDepth, nodes = reports.get(timeout=1)
+        except queue.Empty:
+            if not any(helper.is_alive() for helper in helpers):
+                break # a helper died without reporting
+            continue
+        finished += 1
+        result.nodes += nodes
+        if helperDepth > result.depth:
+            for move in validMoves:
+                if move.moveID == moveID:
+                    result.bestMove = move
+                    result.pv = [move]
+                    result.score = score
+                    result.depth = helperDepth
+                    break
+    for helper in helpers:
+        helper.join()
+    return result
+
+# runs in a helper process until the main search sets stopEvent (or its own budget runs out)
+def helperSearch(index, gs, validMoves, depth, timeLimit, memoryName, sizeMB, generation, stopEvent, reports):
+    memory = shared_memory.SharedMemory(name=memoryName)
+    tt = chessTranspositionTable.transpositionTable(sizeMB, memory.buf)
+    tt.generation = generation # the search moves it on to the same generation as the main search
+    s = chessAI.searcher(tt)
+    s.stopEvent = stopEvent
+    s.firstDepth = 1 + index % 2
+    moves = list(validMoves)
+    random.Random(index).shuffle(moves)
+    result = s.search(gs, moves, min(depth + index % 2, chessAI.MAX_DEPTH), timeLimit)
+    reports.put((result.bestMove.moveID if result.bestMove is not None else 0, result.score, result.depth, result.nodes))
+    tt.release()
+    memory.close()
+
+# pool for rootSplitSearch with the given number of processes, its processes look at the shared table
+def getRootPool(workers):
+    global rootPool, rootPoolWorkers, rootPoolMemory, rootAlpha
+    getSharedTable()
+    if rootPool is None or rootPoolWorkers != workers or rootPoolMemory != sharedMemory.name:
+        if rootPool is None:
+            atexit.register(closeRootPool)
+        else:
+            rootPool.shutdown()
+        rootAlpha = multiprocessing.Value('d', -chessAI.CHECKMATE)
+        rootPool = ProcessPoolExecutor(workers, initializer=initRootWorker,
+                                       initargs=(rootAlpha, sharedMemory.name, sharedSizeMB))
+        rootPoolWorkers = workers
+        rootPoolMemory = sharedMemory.name
+    return rootPool
+
+def closeRootPool():
+    global rootPool, rootPoolWorkers, rootPoolMemory
+    if rootPool is not None:
+        rootPool.shutdown()
+        rootPool = None
+        rootPoolWorkers = 0
+        rootPoolMemory = None
+
+# runs once in every pool process, the shared value can only be handed over when the process starts
+def initRootWorker(alpha, memoryName, sizeMB):
+    global rootAlpha, rootTable, rootMemory
+    rootAlpha = alpha
+    rootMemory = shared_memory.SharedMemory(name=memoryName)
+    rootTable = chessTranspositionTable.transpositionTable(sizeMB, rootMemory.buf)
+
+# same as chessAI.findBestMove at a fixed depth, with the root moves split between workers processes
+def findBestMoveRootSplit(gs, validMoves, depth=None, workers=None):
+    return rootSplitSearch(gs, validMoves, depth, workers).bestMove
+
+# fixed depth search with every root move searched as its own task in the pool
+# returns a chessAI.searchResult (nodes adds up every task and the shallower search),
+# not deterministic (see the top of the file)
+def rootSplitSearch(gs, validMoves, depth=None, workers=None):
+    result = chessAI.searchResult()
+    if len(validMoves) == 0:
+        return result
+    depth = depth or chessAI.DEPTH
+    start = time.perf_counter()
+    pool = getRootPool(workers or WORKERS)
+    tt = getSharedTable()
+    # one ply short here first: fills the shared table the tasks order their moves from, and its best
+    # move goes out first so the shared alpha starts out high
+    # the rest go captures first (most valuable victim, then least valuable attacker)
+    pieceScore = chessAI.pieceScore
+    moves = sorted(validMoves, key=lambda move: pieceScore[move.pieceMoved[1]] - 100 * pieceScore[move.pieceCaptured[1]] if move.pieceCaptured != '--' else 0)
+    if depth > 1:
+        shallow = chessAI.searcher(tt).search(gs, validMoves, depth - 1)
+        result.nodes += shallow.nodes
+        moves.remove(shallow.bestMove)
+        moves.insert(0, shallow.bestMove)
+    rootAlpha.value = -chessAI.CHECKMATE
+    tasks = [pool.submit(searchRootMove, gs, move, depth, tt.generation) for move in moves]
+
+    # a score that failed low only says the move is no better than the alpha it was searched with, the
+    # best exact score is the result. Which moves come back exact depends on the order the tasks finished
+    # in (a move that only equals the best so far fails low), so ties aren't settled by the move order
+    for i in range(len(moves)):
+        score, exact, nodes, pv = tasks[i].result()
+        result.nodes += nodes
+        if exact and (result.bestMove is None or score > result.score):
+            result.bestMove = moves[i]
+            result.score = score
+            result.pv = pv
+    result.depth = depth
+    result.time = time.perf_counter() - start
+    return result
+
+# task run in a pool process: one root move searched to depth with the shared alpha, ordered by what the
+# shared table holds from the shallower search (generation is the one that search stored with)
+# once there is an alpha the move only has to be shown no better than it, which a zero window search
+# does more cheaply (as in chessAI's principal variation search), and is searched again if it is better
+# returns (score, exact, nodes, pv)
+def searchRootMove(gs, move, depth, generation):
+    s = chessAI.searcher(rootTable)
+    s.startSearch()
+    rootTable.generation = generation
+    alpha = rootAlpha.value
+    if alpha > -chessAI.CHECKMATE:
+        score = s.searchRootMove(gs, move, depth, alpha, alpha + chessAI.NULL_WINDOW)
+    if alpha == -chessAI.CHECKMATE or score > alpha:
+        score = s.searchRootMove(gs, move, depth, alpha)
+    exact = score > alpha
+    if exact:
+        with rootAlpha.get_lock():
+            if score > rootAlpha.value:
+                rootAlpha.value = score
+    return score, exact, s.nodes, s.pv
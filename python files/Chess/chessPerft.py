@@ -0,0 +1,136 @@
+# perft: counts the leaf nodes of the legal move tree to a fixed depth and compares them with
+# the published counts, so any change to move generation can be checked for correctness and speed
+# run from the Chess folder:
+#   python chessPerft.py                      every position in perftPositions to its default depth
+#   python chessPerft.py -d 3 -p kiwipete     one position to depth 3
+#   python chessPerft.py --divide -d 2 --fen "<FEN>"   leaf counts under each root move
+#   python chessPerft.py --brute-force        cross check getValidMoves against getValidMovesBruteForce
+
+import argparse, sys, time
+import chessEngine
+
+# name -> (FEN, leaf counts for depth 1, 2, ..., default depth)
+# counts are from https://www.chessprogramming.org/Perft_Results
+perftPositions = {
+    "start": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+              [20, 400, 8902, 197281, 4865609], 4),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4085603], 3),
+    "position 3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                   [14, 191, 2812, 43238, 674624], 4),
+    "position 4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                   [6, 264, 9467, 422333], 3),
+    "position 5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                   [44, 1486, 62379, 2103487], 3),
+    "position 6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                   [46, 2079, 89890, 3894594], 3),
+}
+
+# game state for a perft run, with every promotion piece generated like the published counts expect
+def perftGameState(fen, useBitboards=True):
+    gs = chessEngine.gameState.fromFEN(fen, useBitboards)
+    gs.underPromotions = True
+    return gs
+
+# number of leaf nodes depth plies below the position
+# the last ply is counted straight from the move list instead of being made and undone (bulk counting)
+def perft(gs, depth, bruteForce=False):
+    moves = gs.getValidMovesBruteForce() if bruteForce else gs.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1, bruteForce)
+        gs.undo()
+    return nodes
+
+# leaf counts under each root move, in move generation order
+def divide(gs, depth, bruteForce=False):
+    counts = {}
+    moves = gs.getValidMovesBruteForce() if bruteForce else gs.getValidMoves()
+    for move in moves:
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1, bruteForce)
+        gs.undo()
+    return counts
+
+# runs one position, prints the result line and returns whether it matched the expected count
+def runPosition(name, fen, depth, expected=None, useBitboards=True, bruteForce=False):
+    gs = perftGameState(fen, useBitboards)
+    start = time.perf_counter()
+    nodes = perft(gs, depth, bruteForce)
+    elapsed = time.perf_counter() - start
+    if expected is None:
+        result = ""
+    elif nodes == expected:
+        result = "ok"
+    else:
+        result = "FAIL (expected %d)" % expected
+    print("%-12s depth %d %12d nodes %7.2fs %10.0f nodes/s  %s" % (name, depth, nodes, elapsed, nodes / elapsed if elapsed else 0, result))
+    return expected is None or nodes == expected, nodes, elapsed
+
+# every listed position to its default depth (or the given one), returns True if all counts matched
+def runSuite(depth=None, names=None, useBitboards=True, bruteForce=False):
+    passed = True
+    totalNodes = 0
+    totalTime = 0
+    for name in names or perftPositions:
+        fen, counts, defaultDepth = perftPositions[name]
+        runDepth = min(depth or defaultDepth, len(counts))
+        ok, nodes, elapsed = runPosition(name, fen, runDepth, counts[runDepth - 1], useBitboards, bruteForce)
+        passed = passed and ok
+        totalNodes += nodes
+        totalTime += elapsed
+    print("%-12s %20d nodes %7.2fs %10.0f nodes/s  %s" % ("total", totalNodes, totalTime, totalNodes / totalTime if totalTime else 0,
+                                                           "ok" if passed else "FAILED"))
+    return passed
+
+# compares the divide output of the pinned/checked generator with the brute force one,
+# printing every root move whose subtree differs
+def crossCheck(fen, depth, useBitboards=True):
+    fast = divide(perftGameState(fen, useBitboards), depth)
+    slow = divide(perftGameState(fen, useBitboards), depth, bruteForce=True)
+    same = True
+    for notation in sorted(set(fast) | set(slow)):
+        if fast.get(notation) != slow.get(notation):
+            print("%-6s getValidMoves %s, brute force %s" % (notation, fast.get(notation), slow.get(notation)))
+            same = False
+    return same
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="perft node counts for chessEngine")
+    parser.add_argument("-d", "--depth", type=int, help="search depth (defaults to each position's own)")
+    parser.add_argument("-p", "--position", action="append", choices=list(perftPositions), help="named position (repeatable)")
+    parser.add_argument("--fen", help="position to run instead of the named ones")
+    parser.add_argument("--divide", action="store_true", help="print the leaf count under every root move")
+    parser.add_argument("--brute-force", action="store_true", help="cross check against getValidMovesBruteForce")
+    parser.add_argument("--board-list", action="store_true", help="use the board list move generator instead of bitboards")
+    args = parser.parse_args()
+    useBitboards = not args.board_list
+
+    if args.fen or args.divide:
+        fen = args.fen or perftPositions[(args.position or ["start"])[0]][0]
+        depth = args.depth or 1
+        if args.brute_force:
+            ok = crossCheck(fen, depth, useBitboards)
+            print("getValidMoves matches brute force" if ok else "generators disagree")
+            sys.exit(0 if ok else 1)
+        if args.divide:
+            start = time.perf_counter()
+            counts = divide(perftGameState(fen, useBitboards), depth)
+            for notation, nodes in counts.items():
+                print("%s: %d" % (notation, nodes))
+            print("moves %d, nodes %d, %.2fs" % (len(counts), sum(counts.values()), time.perf_counter() - start))
+        else:
+            runPosition("fen", fen, depth, useBitboards=useBitboards)
+    elif args.brute_force:
+        ok = True
+        for name in args.position or perftPositions:
+            fen, counts, defaultDepth = perftPositions[name]
+            same = crossCheck(fen, min(args.depth or 2, len(counts)), useBitboards)
+            print("%-12s %s" % (name, "ok" if same else "FAIL"))
+            ok = ok and same
+        sys.exit(0 if ok else 1)
+    else:
+        sys.exit(0 if runSuite(args.depth, args.position, useBitboards) else 1)
@@ -0,0 +1,235 @@
+# profiling harness: replays a fixed corpus of games and positions through chessEngine and chessAI,
+# times the hot functions separately for each stage of the game and compares the result with a
+# stored baseline, flagging anything that got slower by more than a threshold
+# run from the Chess folder:
+#   python chessProfile.py                        report, compared with profileBaseline.json
+#   python chessProfile.py --save                 record this run as the new baseline
+#   python chessProfile.py --cprofile run.prof    also profile the whole run with cProfile (read it with pstats)
+#   python chessProfile.py -d 2 --threshold 0.25 --output report.json
+#
+# the timing wrappers are only put in place by enable() and are taken out again by disable(), so the
+# engine runs its own unchanged functions the rest of the time
+# times are inclusive (getValidMoves includes the moves it builds) and include the wrappers' own cost,
+# the baseline is only comparable on the machine that recorded it
+
+import argparse, cProfile, io, json, os, pstats, sys, time
+import chessEngine, chessAI, chessBook, chessBench, chessPerft, chessTranspositionTable
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profileBaseline.json")
+GAMES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "openings.pgn")
+MIN_FLAGGED_TIME = 0.005 # seconds, shorter totals are too noisy to compare
+
+# (owner, attribute) of every function that gets timed
+hotPaths = [
+    (chessEngine.gameState, "getValidMoves"),
+    (chessEngine.gameState, "getCaptureMoves"),
+    (chessEngine.gameState, "inCheck"),
+    (chessEngine.gameState, "squareUnderAttack"),
+    (chessEngine.gameState, "squareAttackedBy"),
+    (chessEngine.gameState, "makeMove"),
+    (chessEngine.gameState, "undo"),
+    (chessEngine.gameState, "getEvaluation"),
+    (chessEngine.Move, "__init__"),
+    (chessEngine, "newMove"),
+    (chessAI, "scoreBoard"),
+]
+
+# positions searched in each stage (the opening ones are reached by playing chessBench's lines)
+stagePositions = {
+    "middlegame": [
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    ],
+    "endgame": [
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "8/k7/3p4/p2P1p2/P2P1P2/8/8/K7 w - - 0 1",
+        "6k1/5p2/6p1/8/7p/8/6PP/6K1 b - - 0 1",
+        "8/5pk1/6p1/8/3R4/6P1/5PK1/1r6 w - - 0 1",
+    ],
+}
+
+timings = {} # function name -> [calls, seconds]
+installed = [] # (owner, attribute, original function) while enabled
+
+def timed(name, function):
+    entry = timings.setdefault(name, [0, 0.0])
+    clock = time.perf_counter
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            entry[0] += 1
+            entry[1] += clock() - start
+    wrapper.__wrapped__ = function
+    return wrapper
+
+# puts the timing wrappers around every hot path
+def enable():
+    if installed:
+        return
+    for owner, attribute in hotPaths:
+        original = owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)
+        name = owner.__name__ + '.' + attribute if isinstance(owner, type) else attribute
+        installed.append((owner, attribute, original))
+        setattr(owner, attribute, timed(name, original))
+
+# puts the original functions back
+def disable():
+    while installed:
+        owner, attribute, original = installed.pop()
+        setattr(owner, attribute, original)
+
+def resetTimings():
+    for entry in timings.values():
+        entry[0] = 0
+        entry[1] = 0.0
+
+# plays every game of the PGN file forward (listing the moves at every ply) and takes it back
+# returns the number of moves made
+def replayGames(path=GAMES_PATH):
+    moves = 0
+    with open(path) as stream:
+        for tags, sanMoves in chessBook.readGames(stream):
+            gs = chessEngine.gameState()
+            for san in sanMoves:
+                gs.makeMove(chessBook.parseSAN(gs, san, gs.getValidMoves()))
+            gs.getValidMoves()
+            moves += len(gs.moveLog)
+            while gs.moveLog:
+                gs.undo()
+    return moves
+
+# perft to perftDepth and a search to depth (from an empty table) of every position, returns the nodes
+def searchPositions(gameStates, depth, perftDepth=2):
+    nodes = 0
+    for gs in gameStates:
+        nodes += chessPerft.perft(gs, perftDepth)
+        s = chessAI.searcher(chessTranspositionTable.transpositionTable(chessAI.hashSizeMB))
+        nodes += s.search(gs, gs.getValidMoves(), depth).nodes
+    return nodes
+
+# (stage name, function doing the work and returning a count of nodes or moves) in a fixed order
+def stages(depth):
+    return [
+        ("games", replayGames),
+        ("opening", lambda: searchPositions(list(chessBench.benchmarkGameStates().values()), depth)),
+        ("middlegame", lambda: searchPositions([chessEngine.gameState.fromFEN(fen) for fen in stagePositions["middlegame"]], depth)),
+        ("endgame", lambda: searchPositions([chessEngine.gameState.fromFEN(fen) for fen in stagePositions["endgame"]], depth)),
+    ]
+
+# runs the corpus with the timing wrappers in place and returns the report
+# {stage: {"time", "work", "functions": {name: {"calls", "time"}}}}
+def profile(depth=3):
+    # the book and tablebases would skip most of the work being measured
+    useBook, useTablebases = chessAI.useBook, chessAI.useTablebases
+    chessAI.useBook = chessAI.useTablebases = False
+    report = {}
+    enable()
+    try:
+        for stage, work in stages(depth):
+            resetTimings()
+            start = time.perf_counter()
+            count = work()
+            elapsed = time.perf_counter() - start
+            report[stage] = {"time": round(elapsed, 6), "work": count,
+                             "functions": {name: {"calls": calls, "time": round(seconds, 6)}
+                                           for name, (calls, seconds) in timings.items() if calls}}
+    finally:
+        disable()
+        chessAI.useBook, chessAI.useTablebases = useBook, useTablebases
+    return report
+
+# the whole corpus under cProfile (without the timing wrappers), written to path
+# returns the top entries by cumulative time as text
+def runCProfile(path, depth=3, top=25):
+    useBook, useTablebases = chessAI.useBook, chessAI.useTablebases
+    chessAI.useBook = chessAI.useTablebases = False
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        for stage, work in stages(depth):
+            work()
+        profiler.disable()
+    finally:
+        chessAI.useBook, chessAI.useTablebases = useBook, useTablebases
+    profiler.dump_stats(path)
+    text = io.StringIO()
+    pstats.Stats(path, stream=text).sort_stats("cumulative").print_stats(top)
+    return text.getvalue()
+
+# lines describing every stage and function that got slower than the baseline by more than threshold
+# (0.1 is 10%), and lines for the stages that did a different amount of work so couldn't be compared
+def compare(report, baseline, threshold):
+    flagged = []
+    skipped = []
+    for stage, result in report.items():
+        old = baseline.get(stage)
+        if old is None:
+            continue
+        if old["work"] != result["work"]:
+            skipped.append("%s: work changed from %d to %d, times not comparable" % (stage, old["work"], result["work"]))
+            continue
+        if result["time"] > old["time"] * (1 + threshold) and result["time"] >= MIN_FLAGGED_TIME:
+            flagged.append("%s: total %.3fs, was %.3fs (%+.0f%%)" % (stage, result["time"], old["time"], 100 * (result["time"] / old["time"] - 1)))
+        for name, timing in result["functions"].items():
+            oldTiming = old["functions"].get(name)
+            if oldTiming is None or timing["time"] < MIN_FLAGGED_TIME:
+                continue
+            if timing["time"] > oldTiming["time"] * (1 + threshold):
+                flagged.append("%s %s: %.3fs, was %.3fs (%+.0f%%)" % (stage, name, timing["time"], oldTiming["time"],
+                                                                      100 * (timing["time"] / oldTiming["time"] - 1)))
+    return flagged, skipped
+
+def printReport(report, baseline=None):
+    for stage, result in report.items():
+        old = (baseline or {}).get(stage)
+        print("%s: %.3fs, %d %s" % (stage, result["time"], result["work"], "moves" if stage == "games" else "nodes"))
+        print("  %-28s %9s %10s %9s %7s %9s" % ("function", "calls", "total ms", "us/call", "share", "baseline"))
+        for name, timing in sorted(result["functions"].items(), key=lambda item: -item[1]["time"]):
+            oldTiming = old["functions"].get(name) if old is not None else None
+            change = "%+.0f%%" % (100 * (timing["time"] / oldTiming["time"] - 1)) if oldTiming and oldTiming["time"] > 0 else ""
+            print("  %-28s %9d %10.1f %9.2f %6.1f%% %9s" % (name, timing["calls"], timing["time"] * 1000,
+                                                           timing["time"] / timing["calls"] * 1e6,
+                                                           100 * timing["time"] / result["time"] if result["time"] else 0, change))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="profile chessEngine and chessAI on a fixed corpus")
+    parser.add_argument("-d", "--depth", type=int, default=3, help="search depth for the positions (default 3)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline report to compare with")
+    parser.add_argument("--save", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.15, help="slowdown that gets flagged (default 0.15, 15%%)")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--cprofile", metavar="PATH", help="also profile the run with cProfile and write the stats to PATH")
+    args = parser.parse_args()
+
+    report = profile(args.depth)
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("depth") != args.depth:
+            print("baseline was recorded at depth %s, not compared" % baseline.get("depth"))
+            baseline = None
+    printReport(report, baseline["stages"] if baseline else None)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"depth": args.depth, "stages": report}, f, indent=1)
+    flagged = []
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump({"depth": args.depth, "stages": report}, f, indent=1)
+        print("baseline saved to " + args.baseline)
+    elif baseline:
+        flagged, skipped = compare(report, baseline["stages"], args.threshold)
+        for line in skipped:
+            print("NOT COMPARED " + line)
+        for line in flagged:
+            print("REGRESSION " + line)
+        if not flagged:
+            print("no regressions over %.0f%% against the baseline" % (100 * args.threshold))
+    if args.cprofile:
+        print(runCProfile(args.cprofile, args.depth))
+    sys.exit(1 if flagged else 0)
@@ -0,0 +1,371 @@
+# endgame tablebases: the distance to mate of every position with a given material of 3 or 4 pieces,
+# worked out backwards from the mates (retrograde analysis) and kept on disk as one signed byte per
+# position, memory mapped when probed so a lookup is a single read
+# run from the Chess folder:
+#   python chessTablebase.py KQK KRK KPK       generate tables (and the smaller ones they can lead into)
+#   python chessTablebase.py --probe "<FEN>"   look a position up
+#
+# a table is named after its material, white's pieces after the first K, black's after the second, the
+# stronger side is always white (positions with black stronger are looked up with the colours swapped)
+# stored values, from the side to move's point of view: 0 draw, n > 0 mates in n plies, n < 0 gets
+# mated in -n-1 plies (-1 is checkmated)
+# castling and en passant are left out, positions where either is still possible aren't probed, and
+# tables with pawns on both sides (where en passant would be part of the play) can't be generated
+
+import argparse, mmap, os, sys, time
+from itertools import product
+from chessBitboards import squareBits, bitSquares, popCount, knightAttacks, kingAttacks, pawnAttacks, rookAttacks, bishopAttacks, queenAttacks
+
+TABLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+MAX_PIECES = 4
+pieceOrder = "QRBNP" # order of the pieces in a table name
+pieceValues = {"Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+noMateTables = ("KK", "KBK", "KNK") # nobody can be mated, every position is a draw
+tables = {} # name -> table bytes (memory mapped file, or a table just generated), None if there is none
+layouts = {}
+
+# name of the table for white's and black's pieces (kings left out), and whether the colours have
+# to be swapped to look the position up in it
+def tableName(white, black):
+    white = "".join(sorted(white, key=pieceOrder.index))
+    black = "".join(sorted(black, key=pieceOrder.index))
+    flip = strength(black) > strength(white)
+    if flip:
+        white, black = black, white
+    return "K" + white + "K" + black, flip
+
+def strength(pieces):
+    return (sum(pieceValues[p] for p in pieces), [-pieceOrder.index(p) for p in pieces])
+
+# how the positions of a table are numbered: side to move, then the square of every piece in the
+# order of self.pieces (white king, black king, white's pieces, black's pieces)
+# the white king is kept in one half of the board by mirroring the files, and without pawns in one
+# quarter by mirroring the ranks too, which takes the table down to 1/2 or 1/4 of the placements
+class tableLayout():
+    def __init__(self, name):
+        second = name.index('K', 1)
+        self.name = name
+        self.pieces = [('w', 'K'), ('b', 'K')] + [('w', p) for p in name[1:second]] + [('b', p) for p in name[second+1:]]
+        self.pawns = 'P' in name
+        self.kingSquares = [sq for sq in range(64) if sq % 8 < 4 and (self.pawns or sq // 8 >= 4)]
+        self.kingIndex = [-1] * 64
+        for i in range(len(self.kingSquares)):
+            self.kingIndex[self.kingSquares[i]] = i
+        self.half = len(self.kingSquares) * 64 ** (len(self.pieces) - 1) # positions with white to move
+        self.size = 2 * self.half
+
+    def index(self, squares, whiteToMove):
+        flip = 7 if squares[0] & 7 >= 4 else 0
+        if not self.pawns and squares[0] < 32:
+            flip |= 56
+        i = self.kingIndex[squares[0] ^ flip]
+        for sq in squares[1:]:
+            i = i * 64 + (sq ^ flip)
+        return i if whiteToMove else i + self.half
+
+    def decode(self, index):
+        whiteToMove = index < self.half
+        i = index % self.half
+        squares = []
+        for j in range(len(self.pieces) - 1):
+            squares.append(i % 64)
+            i //= 64
+        squares.append(self.kingSquares[i])
+        squares.reverse()
+        return squares, whiteToMove
+
+    # tables a capture or promotion can lead into
+    def subtables(self):
+        names = set()
+        white = [p for color, p in self.pieces[2:] if color == 'w']
+        black = [p for color, p in self.pieces[2:] if color == 'b']
+        for side, other in ((white, black), (black, white)):
+            for i in range(len(side)):
+                changes = [side[:i] + side[i+1:]]
+                if side[i] == 'P':
+                    changes += [side[:i] + [promoted] + side[i+1:] for promoted in "QRBN"]
+                for changed in changes:
+                    for captured in [other] + [other[:j] + other[j+1:] for j in range(len(other))]:
+                        names.add(tableName(*((changed, captured) if side is white else (captured, changed)))[0])
+        names.discard(self.name)
+        return sorted(names)
+
+def getLayout(name):
+    if name not in layouts:
+        layouts[name] = tableLayout(name)
+    return layouts[name]
+
+def tablePath(name):
+    return os.path.join(TABLE_DIR, name + ".dtm")
+
+def getTable(name):
+    if name not in tables:
+        tables[name] = None
+        path = tablePath(name)
+        if os.path.exists(path) and os.path.getsize(path) == getLayout(name).size:
+            with open(path, 'rb') as f:
+                tables[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return tables[name]
+
+# stored value of the position in the game state, None if there is no table for it
+def probe(gs):
+    if gs.castleMask or popCount(gs.colorBitboards['w'] | gs.colorBitboards['b']) > MAX_PIECES:
+        return None
+    if gs.enpassantPossible != ():
+        row, col = gs.enpassantPossible
+        pawns = gs.bitboards['wP' if gs.whiteTurn else 'bP']
+        pawnRow = row + 1 if gs.whiteTurn else row - 1
+        if any(0 <= c < 8 and pawns & squareBits[pawnRow*8 + c] for c in (col - 1, col + 1)):
+            return None
+    pieces = []
+    for piece, bitboard in gs.bitboards.items():
+        for sq in bitSquares(bitboard):
+            pieces.append((piece[0], piece[1], sq))
+    return probePieces(pieces, gs.whiteTurn)
+
+# stored value for a list of (colour, piece, square), None if there is no table for it
+def probePieces(pieces, whiteToMove):
+    name, flip = tableName([p for color, p, sq in pieces if color == 'w' and p != 'K'],
+                           [p for color, p, sq in pieces if color == 'b' and p != 'K'])
+    if name in noMateTables:
+        return 0
+    table = getTable(name)
+    if table is None:
+        return None
+    if flip: # swap the colours and turn the board round
+        pieces = [('b' if color == 'w' else 'w', p, sq ^ 56) for color, p, sq in pieces]
+        whiteToMove = not whiteToMove
+    layout = getLayout(name)
+    pieces = list(pieces)
+    squares = []
+    for color, p in layout.pieces:
+        for i in range(len(pieces)):
+            if pieces[i][0] == color and pieces[i][1] == p:
+                squares.append(pieces.pop(i)[2])
+                break
+    value = table[layout.index(squares, whiteToMove)]
+    return value - 256 if value > 127 else value
+
+# the stored value a move reaching a position with the given stored value has for the side making it
+def moverValue(value):
+    if value < 0:
+        return -value # mates one ply later than the opponent gets mated
+    if value > 0:
+        return -value - 2 # gets mated one ply later
+    return 0
+
+def pieceAttacks(p, white, sq, occupied):
+    if p == 'N':
+        return knightAttacks[sq]
+    if p == 'K':
+        return kingAttacks[sq]
+    if p == 'R':
+        return rookAttacks(sq, occupied)
+    if p == 'B':
+        return bishopAttacks(sq, occupied)
+    if p == 'Q':
+        return queenAttacks(sq, occupied)
+    return pawnAttacks[0 if white else 1][sq]
+
+# whether a piece of the given colour attacks sq (captured pieces have square -1)
+def isAttacked(pieces, squares, sq, byWhite, occupied):
+    for i in range(len(pieces)):
+        if (pieces[i][0] == 'w') == byWhite and squares[i] >= 0:
+            if pieceAttacks(pieces[i][1], byWhite, squares[i], occupied) & squareBits[sq]:
+                return True
+    return False
+
+# (piece index, to square, index of the captured piece or -1, promotion piece or None) for every
+# pseudo legal move of the side to move
+def forwardMoves(pieces, squares, white, occupied):
+    own = 0
+    for i in range(len(pieces)):
+        if (pieces[i][0] == 'w') == white:
+            own |= squareBits[squares[i]]
+    for i in range(len(pieces)):
+        color, p = pieces[i]
+        if (color == 'w') != white:
+            continue
+        sq = squares[i]
+        if p == 'P':
+            step = -8 if white else 8
+            targets = []
+            if not occupied & squareBits[sq + step]:
+                targets.append(sq + step)
+                if sq // 8 == (6 if white else 1) and not occupied & squareBits[sq + 2*step]:
+                    targets.append(sq + 2*step)
+            targets.extend(bitSquares(pawnAttacks[0 if white else 1][sq] & occupied & ~own))
+            for to in targets:
+                captured = squares.index(to) if occupied & squareBits[to] else -1
+                if to // 8 == (0 if white else 7):
+                    for promoted in "QRBN":
+                        yield i, to, captured, promoted
+                else:
+                    yield i, to, captured, None
+        else:
+            for to in bitSquares(pieceAttacks(p, white, sq, occupied) & ~own):
+                yield i, to, squares.index(to) if occupied & squareBits[to] else -1, None
+
+# indexes of the positions (other side to move) that reach this one with a move that isn't a capture
+# or promotion; every one is given once for each move that leads here
+def predecessors(layout, squares, white, occupied):
+    pieces = layout.pieces
+    mover = not white
+    for i in range(len(pieces)):
+        color, p = pieces[i]
+        if (color == 'w') != mover:
+            continue
+        sq = squares[i]
+        if p == 'P':
+            back = 8 if mover else -8
+            origins = []
+            row = sq // 8 + (1 if mover else -1)
+            if 1 <= row <= 6 and not occupied & squareBits[sq + back]:
+                origins.append(sq + back)
+                if sq // 8 == (4 if mover else 3) and not occupied & squareBits[sq + 2*back]:
+                    origins.append(sq + 2*back)
+        else:
+            origins = bitSquares(pieceAttacks(p, mover, sq, occupied) & ~occupied)
+        for origin in origins:
+            before = list(squares)
+            before[i] = origin
+            beforeOccupied = occupied ^ squareBits[sq] ^ squareBits[origin]
+            # the side that didn't move can't have been left in check
+            if isAttacked(pieces, before, squares[0 if white else 1], mover, beforeOccupied):
+                continue
+            yield layout.index(before, mover)
+
+# works out the table for name (and any table it leads into that isn't there yet) and writes it
+def generate(name, log=print):
+    second = name.index('K', 1)
+    if 'P' in name[1:second] and 'P' in name[second+1:]:
+        raise ValueError(name + " has pawns on both sides, and en passant isn't worked into the tables")
+    layout = getLayout(name)
+    for subtable in layout.subtables():
+        if subtable not in noMateTables and getTable(subtable) is None:
+            generate(subtable, log)
+    start = time.perf_counter()
+    pieces = layout.pieces
+    size = layout.size
+    done = bytearray(size) # 1 once the value is final
+    values = bytearray(size)
+    movesLeft = [0] * size # moves within the table not yet known to lose for the side making them
+    escapes = bytearray(size) # 1 if a capture or promotion draws or wins, so the position can't be lost
+    longestLoss = bytearray(size) # plies of the slowest loss through a capture or promotion
+    buckets = [[] for plies in range(128)] # (index, value) to make final, by plies to mate
+    kingPieces = (0, 1)
+
+    # first pass: mates, stalemates, and what the captures and promotions lead to
+    for whiteToMove in (True, False):
+        ownKing = kingPieces[0 if whiteToMove else 1]
+        for kingSquare in layout.kingSquares:
+            for rest in product(range(64), repeat=len(pieces) - 1):
+                squares = [kingSquare] + list(rest)
+                occupied = 0
+                for sq in squares:
+                    occupied |= squareBits[sq]
+                index = layout.index(squares, whiteToMove)
+                if popCount(occupied) != len(squares) or not legal(pieces, squares, whiteToMove, occupied):
+                    done[index] = 1
+                    continue
+                moves = 0
+                bestWin = 0
+                for i, to, captured, promoted in forwardMoves(pieces, squares, whiteToMove, occupied):
+                    after = list(squares)
+                    after[i] = to
+                    if captured >= 0:
+                        after[captured] = -1
+                    afterOccupied = (occupied ^ squareBits[squares[i]]) | squareBits[to]
+                    if isAttacked(pieces, after, after[ownKing], not whiteToMove, afterOccupied):
+                        continue
+                    moves += 1
+                    if captured < 0 and promoted is None:
+                        movesLeft[index] += 1
+                        continue
+                    value = moverValue(probePieces([(pieces[j][0], promoted if j == i and promoted else pieces[j][1], after[j])
+                                                    for j in range(len(pieces)) if after[j] >= 0], not whiteToMove))
+                    if value > 0:
+                        escapes[index] = 1
+                        if bestWin == 0 or value < bestWin:
+                            bestWin = value
+                    elif value == 0:
+                        escapes[index] = 1
+                    elif -value - 1 > longestLoss[index]:
+                        longestLoss[index] = -value - 1
+                if moves == 0:
+                    if isAttacked(pieces, squares, squares[ownKing], not whiteToMove, occupied):
+                        buckets[0].append((index, -1)) # checkmate
+                    else:
+                        done[index] = 1 # stalemate
+                elif bestWin:
+                    buckets[bestWin].append((index, bestWin))
+                elif movesLeft[index] == 0 and not escapes[index]:
+                    buckets[longestLoss[index]].append((index, -longestLoss[index] - 1))
+
+    # then outwards from the mates one ply at a time, so every position is made final with its
+    # shortest win (or longest loss)
+    for plies in range(len(buckets)):
+        for index, value in buckets[plies]:
+            if done[index]:
+                continue
+            done[index] = 1
+            values[index] = value & 0xff
+            squares, whiteToMove = layout.decode(index)
+            occupied = 0
+            for sq in squares:
+                occupied |= squareBits[sq]
+            for before in predecessors(layout, squares, whiteToMove, occupied):
+                if done[before]:
+                    continue
+                if value < 0: # a move into a lost position wins
+                    if plies + 1 >= len(buckets):
+                        raise ValueError(name + " has mates too long to store")
+                    buckets[plies + 1].append((before, plies + 1))
+                else:
+                    movesLeft[before] -= 1
+                    if movesLeft[before] == 0 and not escapes[before]: # every move loses
+                        loss = max(plies + 1, longestLoss[before])
+                        if loss >= len(buckets):
+                            raise ValueError(name + " has mates too long to store")
+                        buckets[loss].append((before, -loss - 1))
+        buckets[plies] = None
+
+    os.makedirs(TABLE_DIR, exist_ok=True)
+    with open(tablePath(name), 'wb') as f:
+        f.write(values)
+    tables[name] = values
+    longest = max(value - 256 if value > 127 else value for value in values)
+    log("%-6s %9d positions, longest mate %d plies, %.1fs" % (name, size, longest, time.perf_counter() - start))
+
+# the side not to move can't be in check, and pawns can't stand on the first or last rank
+def legal(pieces, squares, whiteToMove, occupied):
+    for i in range(len(pieces)):
+        if pieces[i][1] == 'P' and squares[i] // 8 in (0, 7):
+            return False
+    return not isAttacked(pieces, squares, squares[1 if whiteToMove else 0], whiteToMove, occupied)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="generate or probe the endgame tablebases")
+    parser.add_argument("tables", nargs="*", help="tables to generate, like KQK or KRKP")
+    parser.add_argument("--probe", metavar="FEN", help="print the stored value of a position")
+    args = parser.parse_args()
+    if args.probe:
+        import chessEngine
+        value = probe(chessEngine.gameState.fromFEN(args.probe))
+        if value is None:
+            print("not in the tablebases")
+        elif value == 0:
+            print("draw")
+        else:
+            print("mates in %d plies" % value if value > 0 else "mated in %d plies" % (-value - 1))
+    for name in args.tables:
+        name = name.upper()
+        second = name.find('K', 1)
+        if not name.startswith('K') or second < 0 or len(name) > MAX_PIECES or name.count('K') != 2 or \
+                any(p not in pieceOrder for p in name[1:second] + name[second+1:]):
+            sys.exit("not a table name: " + name)
+        name = tableName(name[1:second], name[second+1:])[0]
+        if 'P' in name[1:name.index('K', 1)] and 'P' in name[name.index('K', 1)+1:]:
+            sys.exit(name + " has pawns on both sides, and en passant isn't worked into the tables")
+        if name not in noMateTables:
+            generate(name)
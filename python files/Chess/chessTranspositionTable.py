@@ -0,0 +1,123 @@
+# fixed size transposition table for the search in chessAI
+# entries live in one flat buffer of 64 bit words instead of a dict of objects, so memory use is
+# fixed up front and the buffer can be handed to other processes
+#
+# each bucket holds two entries: the first keeps the deepest search of a position (depth-preferred),
+# the second is always overwritten (always-replace)
+# each entry is two words, (key ^ data) and data, so a half written entry just fails the key check
+#
+# data word layout (low bit first):
+#   score      32 bits (signed, score * scoreScale)
+#   move       16 bits (Move.moveID of the best move, 0 if none)
+#   depth       8 bits
+#   flag        2 bits (exact, lowerBound or upperBound)
+#   generation  6 bits (which search stored it, older entries get replaced first)
+
+exact = 1
+lowerBound = 2 # score is at least this (the search failed high)
+upperBound = 3 # score is at most this (the search failed low)
+
+scoreScale = 1000 # scores are stored as ints, this keeps 3 decimal places
+entryWords = 2
+bucketWords = 2 * entryWords
+bucketBytes = bucketWords * 8
+
+# number of buckets that fit in sizeMB, rounded down to a power of two
+def bucketCount(sizeMB):
+    buckets = 1
+    while buckets * 2 * bucketBytes <= sizeMB * 1024 * 1024:
+        buckets *= 2
+    return buckets
+
+# bytes of buffer a table of sizeMB needs (for allocating shared memory up front)
+def tableBytes(sizeMB):
+    return bucketCount(sizeMB) * bucketBytes
+
+class transpositionTable():
+    # sizeMB is the memory budget, rounded down to a power of two number of buckets
+    # buffer lets the table sit on memory owned by someone else (must be writable and big enough),
+    # for example shared memory several search processes use at once
+    def __init__(self, sizeMB=16, buffer=None):
+        buckets = bucketCount(sizeMB)
+        self.buckets = buckets
+        self.mask = buckets - 1
+        self.sizeBytes = buckets * bucketBytes
+        if buffer is None:
+            buffer = bytearray(self.sizeBytes)
+        self.buffer = buffer
+        self.words = memoryview(buffer)[:self.sizeBytes].cast('Q')
+        self.generation = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0 # stores that replaced a different position
+
+    # empties the table (the memory stays allocated)
+    def clear(self):
+        memoryview(self.buffer)[:self.sizeBytes] = bytes(self.sizeBytes)
+        self.generation = 0
+
+    # lets go of the buffer, shared memory can't be closed while a table still looks at it
+    def release(self):
+        self.words.release()
+
+    # called once per search, entries from earlier searches become the first to be replaced
+    def newSearch(self):
+        self.generation = (self.generation + 1) & 63
+
+    # returns (depth, flag, score, moveID) for the position, or None if it isn't stored
+    def probe(self, key):
+        self.probes += 1
+        words = self.words
+        index = (key & self.mask) * bucketWords
+        for slot in (index, index + entryWords):
+            data = words[slot + 1]
+            if data and words[slot] ^ data == key:
+                self.hits += 1
+                score = data & 0xFFFFFFFF
+                if score >= 0x80000000:
+                    score -= 0x100000000
+                return ((data >> 48) & 0xFF, (data >> 56) & 3, score / scoreScale, (data >> 32) & 0xFFFF)
+        return None
+
+    def store(self, key, depth, flag, score, moveID):
+        self.stores += 1
+        words = self.words
+        index = (key & self.mask) * bucketWords
+        data = ((int(round(score * scoreScale)) & 0xFFFFFFFF) | (moveID & 0xFFFF) << 32
+                | min(max(depth, 0), 255) << 48 | flag << 56 | self.generation << 58)
+
+        # the deep slot keeps its entry unless the new search went at least as deep,
+        # it is for the same position, or it was stored by an older search
+        deepData = words[index + 1]
+        if (not deepData or words[index] ^ deepData == key or depth >= (deepData >> 48) & 0xFF
+                or (deepData >> 58) != self.generation):
+            slot = index
+            oldData = deepData
+        else:
+            slot = index + entryWords
+            oldData = words[slot + 1]
+        if oldData and words[slot] ^ oldData != key:
+            self.overwrites += 1
+        words[slot] = key ^ data
+        words[slot + 1] = data
+
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    # fraction of entries in use, estimated from the first buckets
+    def usage(self, sample=1000):
+        sample = min(sample, self.buckets)
+        used = 0
+        for i in range(sample * bucketWords):
+            if i % entryWords == 1 and self.words[i]:
+                used += 1
+        return used / (sample * 2)
+
+    def getStats(self):
+        return {"sizeMB": self.sizeBytes / (1024 * 1024), "probes": self.probes, "hits": self.hits,
+                "hitRate": self.hitRate(), "stores": self.stores, "overwrites": self.overwrites,
+                "usage": self.usage()}
@@ -0,0 +1,170 @@
+# UCI (universal chess interface) front end, so the engine can be run by chess GUIs and match runners
+# without the pygame window: python chessUCI.py (run from the Chess folder), then talk UCI on stdin/stdout
+#
+# supported: uci, isready, ucinewgame, setoption name Hash|OwnBook value <x>, position startpos|fen ... [moves ...],
+# go [depth|movetime|wtime|btime|winc|binc|movestogo|nodes|infinite], stop, quit
+# the search runs on a background thread, so stop (and isready) are answered while it is thinking
+
+import sys, threading
+import chessEngine, chessAI
+
+ENGINE_NAME = "Personal-Projects Chess"
+ENGINE_AUTHOR = "Personal-Projects"
+MOVE_OVERHEAD = 0.05 # seconds kept back from every move for the GUI and process switching
+
+class uciEngine():
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock() # the search thread writes info and bestmove lines too
+        self.gs = self.newGameState()
+        self.searcher = None
+        self.searchThread = None
+        self.infinite = False
+        self.stopEvent = threading.Event() # set by stop, an infinite search waits for it before answering
+
+    # positions are played with every promotion choice available, UCI move strings name the piece
+    def newGameState(self, fen=None):
+        gs = chessEngine.gameState() if fen is None else chessEngine.gameState.fromFEN(fen)
+        gs.underPromotions = True
+        return gs
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    # handles one line of input, returns False on quit
+    def handle(self, line):
+        words = line.split()
+        if not words:
+            return True
+        command = words[0]
+        if command == "uci":
+            self.send("id name " + ENGINE_NAME)
+            self.send("id author " + ENGINE_AUTHOR)
+            self.send("option name Hash type spin default %d min 1 max 4096" % chessAI.hashSizeMB)
+            self.send("option name OwnBook type check default %s" % ("true" if chessAI.useBook else "false"))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "ucinewgame":
+            self.stopSearch()
+            chessAI.getTranspositionTable().clear()
+            self.gs = self.newGameState()
+        elif command == "setoption":
+            self.setOption(words[1:])
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(words[1:])
+        elif command == "go":
+            self.stopSearch()
+            self.go(words[1:])
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        # anything else is ignored, as UCI asks
+        return True
+
+    def setOption(self, words):
+        if "name" not in words or "value" not in words:
+            return
+        name = " ".join(words[words.index("name") + 1:words.index("value")]).lower()
+        value = " ".join(words[words.index("value") + 1:])
+        if name == "hash" and value.isdigit():
+            self.stopSearch()
+            chessAI.hashSizeMB = max(1, int(value))
+            chessAI.transpositionTable = None # rebuilt at the new size on the next search
+        elif name == "ownbook":
+            chessAI.useBook = value.lower() == "true"
+
+    # position startpos [moves ...] or position fen <fen> [moves ...]
+    def setPosition(self, words):
+        moves = words.index("moves") if "moves" in words else len(words)
+        try:
+            if words and words[0] == "fen":
+                gs = self.newGameState(" ".join(words[1:moves]))
+            else:
+                gs = self.newGameState()
+        except ValueError as error:
+            self.send("info string " + str(error))
+            return
+        for notation in words[moves + 1:]:
+            for move in gs.getValidMoves():
+                if move.getChessNotation() == notation:
+                    gs.makeMove(move)
+                    break
+            else:
+                self.send("info string illegal move " + notation)
+                break
+        self.gs = gs
+
+    def go(self, words):
+        options = {}
+        for i in range(len(words) - 1):
+            if words[i] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes") and words[i+1].isdigit():
+                options[words[i]] = int(words[i+1])
+        depth = min(options.get("depth", chessAI.MAX_DEPTH), chessAI.MAX_DEPTH)
+        nodeLimit = options.get("nodes")
+        timeLimit = None
+        if "movetime" in options:
+            timeLimit = options["movetime"] / 1000
+        elif ("wtime" if self.gs.whiteTurn else "btime") in options:
+            # an even share of the clock over the moves left (30 if not told), plus most of the increment
+            remaining = options["wtime" if self.gs.whiteTurn else "btime"] / 1000
+            increment = options.get("winc" if self.gs.whiteTurn else "binc", 0) / 1000
+            timeLimit = min(remaining / options.get("movestogo", 30) + increment * 0.8, remaining / 2)
+        if timeLimit is not None:
+            timeLimit = max(timeLimit - MOVE_OVERHEAD, 0.01)
+        # with no limit at all the search runs until stop
+        self.infinite = "infinite" in words or ("depth" not in options and nodeLimit is None and timeLimit is None)
+
+        self.stopEvent.clear()
+        self.searcher = chessAI.searcher()
+        self.searcher.onIteration = self.sendInfo
+        self.searchThread = threading.Thread(target=self.runSearch, args=(self.gs, self.searcher, depth, timeLimit, nodeLimit),
+                                             daemon=True)
+        self.searchThread.start()
+
+    # runs on the search thread, answers with bestmove when the search is over
+    def runSearch(self, gs, searcher, depth, timeLimit, nodeLimit):
+        validMoves = gs.getValidMoves()
+        result = None
+        if not self.infinite: # analysis always searches
+            result = chessAI.bookResult(gs, validMoves) or chessAI.tablebaseResult(gs, validMoves)
+        if result is None:
+            result = searcher.search(gs, validMoves, depth, timeLimit, nodeLimit)
+        if self.infinite:
+            self.stopEvent.wait() # UCI only allows the answer once the GUI says stop
+        self.send("bestmove " + (result.bestMove.getChessNotation() if result.bestMove is not None else "0000"))
+
+    # stops a running search and waits for its bestmove to go out
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.searcher.stop()
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+    # info line after every finished depth
+    def sendInfo(self, result):
+        if abs(result.score) >= chessAI.MATE_SCORE:
+            plies = chessAI.CHECKMATE - abs(result.score)
+            score = "mate %d" % ((plies + 1) // 2 if result.score > 0 else -((plies + 1) // 2))
+        else:
+            score = "cp %d" % round(result.score * 100)
+        milliseconds = int(result.time * 1000)
+        nps = int(result.nodes / result.time) if result.time > 0 else 0
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" % (result.depth, score, result.nodes, nps, milliseconds,
+                                                                              " ".join(move.getChessNotation() for move in result.pv)))
+
+def main():
+    engine = uciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stopSearch()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+# run from the Chess folder: python -m pytest test_chessAI.py
+
+import chessEngine, chessAI, chessBench, chessTranspositionTable
+
+def playedFrom(name, moves):
+    gs = chessBench.benchmarkGameStates()[name]
+    return chessBench.playMoves(gs, moves)
+
+# fixed depth search from an empty table with the pruning that changes scores left out
+def searchScore(gs, depth, **switches):
+    options = dict(nullMove=False, lateMoveReductions=False, checkExtensions=False, aspiration=False)
+    options.update(switches)
+    s = chessAI.searcher(chessTranspositionTable.transpositionTable(16), **options)
+    s.tablebases = False
+    return s.search(gs, gs.getValidMoves(), depth).score
+
+# delta pruning in the quiescence search used to return a fail soft score below what the pruned captures
+# could reach, so a narrower window (pvs or aspiration) could end up with a different score
+def test_windowsAgreeAfterDeltaPruning():
+    gs = playedFrom("queens gambit", "c4d5")
+    full = searchScore(gs, 2, pvs=False)
+    assert full == searchScore(gs, 2, pvs=True)
+    assert full == searchScore(gs, 2, pvs=False, aspiration=True)
+    assert full == searchScore(gs, 2, pvs=True, aspiration=True)
+
+# the zero window searches and their re-searches have to come to the score a full window search does
+def test_pvsKeepsTheScore():
+    for name, gs in chessBench.benchmarkGameStates().items():
+        assert searchScore(gs, 3, pvs=True) == searchScore(gs, 3, pvs=False), name
+    gs = playedFrom("queens gambit", "c4d5")
+    assert searchScore(gs, 3, pvs=True) == searchScore(gs, 3, pvs=False)
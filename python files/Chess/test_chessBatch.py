@@ -0,0 +1,62 @@
+# run from the Chess folder: python -m pytest test_chessBatch.py
+
+import json
+import pytest
+import chessBatch
+
+positions = ["rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+             "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+             "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+             "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8"]
+
+def writeInput(tmp_path):
+    inputPath = tmp_path / "positions.fen"
+    inputPath.write_text("\n".join(positions) + "\n")
+    return str(inputPath)
+
+def readRecords(outputPath):
+    with open(outputPath) as f:
+        return [json.loads(line) for line in f]
+
+def test_resumeAfterHalfWrittenLine(tmp_path):
+    inputPath = writeInput(tmp_path)
+    outputPath = str(tmp_path / "results.jsonl")
+    chessBatch.analyseFile(inputPath, outputPath, workers=1, evaluateOnly=True)
+    complete = readRecords(outputPath)
+    assert [record["line"] for record in complete] == [1, 2, 3, 4]
+
+    # a run killed in the middle of writing the third record
+    with open(outputPath, 'rb') as f:
+        data = f.read()
+    lines = data.split(b'\n')
+    with open(outputPath, 'wb') as f:
+        f.write(lines[0] + b'\n' + lines[1] + b'\n' + lines[2][:len(lines[2]) // 2])
+
+    assert chessBatch.resumePoint(outputPath) == (complete[1]["line"], complete[1]["next"])
+    assert readRecords(outputPath) == complete[:2] # the partial line was cut off
+
+    count, elapsed = chessBatch.analyseFile(inputPath, outputPath, workers=1, evaluateOnly=True, resume=True)
+    assert count == 2
+    resumed = readRecords(outputPath)
+    assert [record["line"] for record in resumed] == [1, 2, 3, 4]
+    assert [record["score"] for record in resumed] == [record["score"] for record in complete]
+
+def test_resumeEmptyOrMissingOutput(tmp_path):
+    outputPath = tmp_path / "results.jsonl"
+    assert chessBatch.resumePoint(str(outputPath)) == (0, 0)
+    outputPath.write_bytes(b'{"line": 1, "ne')
+    assert chessBatch.resumePoint(str(outputPath)) == (0, 0)
+    assert outputPath.read_bytes() == b''
+
+# --evaluate scores in batches with chessNumpy when numpy is there, the scores have to be the ones
+# analysePosition gives one position at a time
+def test_batchEvaluationMatchesOneAtATime(tmp_path):
+    pytest.importorskip("numpy")
+    inputPath = writeInput(tmp_path)
+    with open(inputPath, 'rb') as stream:
+        batched = list(chessBatch.analysePositions(chessBatch.readPositions(stream), evaluateOnly=True))
+    for record, fen in zip(batched, positions):
+        single = chessBatch.analysePosition(fen, None, None, None, True)
+        assert record["score"] == pytest.approx(single["score"])
+    with open(inputPath, 'rb') as stream:
+        assert len(list(chessBatch.evaluatePositions(chessBatch.readPositions(stream), 3))) == len(positions)
@@ -0,0 +1,29 @@
+# run from the Chess folder: python -m pytest test_chessEngine.py
+
+import pytest
+import chessEngine
+
+def test_fromFENKeepsGoodPositions():
+    for fen in ["rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1",
+                "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2",
+                "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"]:
+        assert chessEngine.gameState.fromFEN(fen).toFEN() == fen
+
+@pytest.mark.parametrize("fen", [
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq e3 0 1", # white to move can't take on the 3rd rank
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR b KQkq c6 0 2", # nor black on the 6th
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq d6 0 1", # no pawn moved two squares to d5
+])
+def test_fromFENRejectsBadEnpassant(fen):
+    with pytest.raises(ValueError):
+        chessEngine.gameState.fromFEN(fen)
+
+@pytest.mark.parametrize("fen", [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBN1 w KQkq - 0 1", # no rook on h1
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQ1BNR w KQkq - 0 1", # no white king on e1
+    "1nbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", # no rook on a8
+    "4k3/8/8/8/8/8/8/4K3 w k - 0 1",
+])
+def test_fromFENRejectsCastlingWithoutPieces(fen):
+    with pytest.raises(ValueError):
+        chessEngine.gameState.fromFEN(fen)
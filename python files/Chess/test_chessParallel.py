@@ -0,0 +1,18 @@
+# run from the Chess folder: python -m pytest test_chessParallel.py
+
+import chessAI, chessBench, chessParallel, chessTranspositionTable
+
+# with one worker the root moves are searched in a fixed order, so the split search has to come to
+# the same score as the single process search (and the same move, where no other scores the same)
+def test_rootSplitMatchesSingleProcess():
+    useTablebases = chessAI.useTablebases
+    chessAI.useTablebases = False
+    try:
+        for name, gs in chessBench.benchmarkGameStates().items():
+            single = chessAI.searcher(chessTranspositionTable.transpositionTable(16)).search(gs, gs.getValidMoves(), 3)
+            chessParallel.getSharedTable().clear()
+            split = chessParallel.rootSplitSearch(gs, gs.getValidMoves(), 3, 1)
+            assert split.score == single.score, name
+            assert split.bestMove == single.bestMove, name
+    finally:
+        chessAI.useTablebases = useTablebases